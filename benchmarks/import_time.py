@@ -0,0 +1,45 @@
+'''
+Startup cost of `import core` in a fresh interpreter, compared with the
+eager imports it used to pay for (asyncio, typing) and with touching the
+lazily loaded invoke helpers.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+'''
+import subprocess
+import sys
+import time
+
+RUNS = 20
+
+CASES = [
+    ('python (baseline)', 'pass'),
+    ('import core', 'import core'),
+    ('import core; core.invoke', 'import core; core.invoke'),
+    ('import asyncio, typing', 'import asyncio, typing'),
+]
+
+
+def measure(code: str) -> float:
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-S', '-c', code], check=True)
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best
+
+
+def main():
+    # warm the bytecode cache so the first case does not pay for compiling
+    subprocess.run([sys.executable, '-c', 'import core; core.invoke'], check=True)
+    for name, code in CASES:
+        print('%-28s %7.2f ms' % (name, measure(code) * 1000))
+    loaded = subprocess.run([sys.executable, '-c',
+                             'import core, sys; print("asyncio" in sys.modules)'],
+                            capture_output=True, text=True, check=True).stdout.strip()
+    print('asyncio loaded by `import core`:', loaded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Cost of entering and leaving a state running a child machine.
+
+Run from the repository root:
+    python -m benchmarks.invoke
+'''
+import time
+
+from core import createMachine, state, transition, interpret, invoke, nested, state as final
+
+N = 100000
+
+
+def child():
+    return createMachine({
+        'working': state(transition('finish', 'done')),
+        'done': final()
+    }, lambda ctx: {'items': []})
+
+
+def machine(make):
+    return createMachine({
+        'idle': state(transition('toggle', 'running')),
+        'running': make(child(), transition('toggle', 'idle'))
+    })
+
+
+def measure(make) -> float:
+    service = interpret(machine(make))
+    start = time.perf_counter()
+    for _ in range(N):
+        service.send('toggle')
+    return time.perf_counter() - start
+
+
+def main():
+    for name, make in [('invoke', invoke),
+                       ('invoke reuse', lambda m, *t: invoke(m, *t, reuse=True)),
+                       ('nested', nested)]:
+        took = measure(make)
+        print('%-14s %8.0f transitions/s %6.2f us/transition' %
+              (name, N / took, took / N * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+'''
+Burst of services entering an invoke state at once, with and without a
+concurrency limit: completion time, peak concurrency and queue metrics.
+
+Run from the repository root:
+    python -m benchmarks.limits
+'''
+import asyncio
+import time
+
+from core import createMachine, state, transition, interpret, invoke
+from core import limits
+
+N = 5000
+
+
+async def measure(concurrency) -> tuple:
+    if concurrency is None:
+        limits.unlimit()
+    else:
+        limits.limit(concurrency=concurrency)
+    active = [0, 0]
+
+    async def downstream(ctx, ev):
+        active[0] += 1
+        active[1] = max(active[0], active[1])
+        await asyncio.sleep(0.001 * active[0] / 100)
+        active[0] -= 1
+    machine = createMachine({
+        'idle': state(transition('start', 'working')),
+        'working': invoke(downstream, transition('done', 'idle'))
+    })
+    services = [interpret(machine) for _ in range(N)]
+    start = time.perf_counter()
+    for service in services:
+        service.send('start')
+    while any(s.machine.current == 'working' for s in services):
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start, active[1]
+
+
+def main():
+    for concurrency in [None, 1000, 100]:
+        took, peak = asyncio.run(measure(concurrency))
+        line = 'limit %-5s %6.2f s peak %5d' % (concurrency, took, peak)
+        if limits.limiter is not None:
+            stats = limits.limiter.stats()
+            line += ' max depth %5d mean wait %6.1f ms max wait %6.1f ms' % (
+                stats['maxDepth'], stats['meanWait'] * 1000, stats['maxWait'] * 1000)
+        print(line)
+    limits.unlimit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Throughput of send for the supported kinds of events.
+
+Run from the repository root:
+    python -m benchmarks.send
+'''
+import time
+
+from core import createMachine, state, transition, interpret, Event
+
+N = 200000
+
+
+class Typed:
+    def __init__(self, type):
+        self.type = type
+
+
+def machine():
+    return createMachine({
+        'off': state(transition('toggle', 'on')),
+        'on': state(transition('toggle', 'off'))
+    })
+
+
+def measure(event) -> float:
+    service = interpret(machine(), lambda: None)
+    start = time.perf_counter()
+    for _ in range(N):
+        service.send(event)
+    return time.perf_counter() - start
+
+
+def main():
+    for name, event in [('str', 'toggle'),
+                        ('Event', Event('toggle')),
+                        ('object with type', Typed('toggle')),
+                        ('dict', {'type': 'toggle'})]:
+        took = measure(event)
+        print('%-18s %8.0f events/s %6.2f us/event' %
+              (name, N / took, took / N * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Throughput of core.server over localhost, one send per request against
+batches, pipelined on a pool of connections.
+
+Run from the repository root:
+    python -m benchmarks.server
+'''
+import asyncio
+import time
+
+from core import createMachine, state, transition, interpret
+from core.server import Server, Client
+
+N = 20000
+
+
+def machine():
+    return createMachine({
+        'off': state(transition('toggle', 'on')),
+        'on': state(transition('toggle', 'off'))
+    })
+
+
+async def measure(batch: int, size: int) -> float:
+    server = Server(factory=lambda key: interpret(machine()))
+    await server.start()
+    client = Client(port=server.port, size=size)
+    sends = [(str(i % 100), 'toggle') for i in range(batch)]
+    start = time.perf_counter()
+    await asyncio.gather(*[client.batch(sends) for _ in range(N // batch)])
+    took = time.perf_counter() - start
+    await client.close()
+    await server.close()
+    return took
+
+
+def main():
+    for batch, size in [(1, 1), (1, 4), (100, 1), (100, 4)]:
+        took = asyncio.run(measure(batch, size))
+        print('batch %-4d connections %-2d %8.0f sends/s' %
+              (batch, size, N / took))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+'''
+Soak test: drives services of several kinds of machines for a number of
+events while sampling the memory retained (tracemalloc) and the count of
+live objects of the library types, and fails when they grow per service.
+
+Run from the repository root (exits with 1 when a kind leaks):
+    python -m benchmarks.soak [events per kind]
+'''
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+import warnings
+
+from core import createMachine, state, transition, reduce, immediate, interpret, invoke, state as final
+
+EVENTS = 1000000
+SERVICES = 100
+SAMPLES = 10
+# retained bytes per service allowed to grow between the first and last samples
+BUDGET = 256
+WATCHED = ('Machine', 'MachineDef', 'Service', 'Pooled', 'Event', 'Timer', 'function', 'cell')
+
+
+def flat():
+    machine = createMachine({
+        'off': state(transition('toggle', 'on', reduce(lambda ctx, ev: ctx | {'n': ctx['n'] + 1}))),
+        'on': state(transition('toggle', 'off'))
+    }, lambda: {'n': 0})
+
+    def drive(service):
+        service.send('toggle')
+        return 1
+    return machine, drive
+
+
+def immediates():
+    machine = createMachine({
+        'idle': state(transition('go', 'one')),
+        'one': state(immediate('two', reduce(lambda ctx, ev: ctx | {'n': ctx['n'] + 1}))),
+        'two': state(immediate('three')),
+        'three': state(immediate('idle'))
+    }, lambda: {'n': 0})
+
+    def drive(service):
+        service.send('go')
+        return 4
+    return machine, drive
+
+
+def invoked(reuse: bool = False):
+    child = createMachine({
+        'working': state(transition('finish', 'done')),
+        'done': final()
+    }, lambda ctx: {'n': ctx['n']})
+    machine = createMachine({
+        'idle': state(transition('start', 'running')),
+        'running': invoke(child, transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'n': ctx['n'] + 1})),
+                          reuse=reuse)
+    }, lambda: {'n': 0})
+
+    def drive(service):
+        service.send('start')
+        service.child.send('finish')
+        return 2
+    return machine, drive
+
+
+def pooled():
+    return invoked(reuse=True)
+
+
+def asynchronous():
+    async def work(ctx, ev):
+        return ctx['n']
+    machine = createMachine({
+        'idle': state(transition('start', 'running')),
+        'running': invoke(work, transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'n': ev.data + 1})))
+    }, lambda: {'n': 0})
+
+    def drive(service):
+        # no loop running: the invoke runs to completion in the send
+        service.send('start')
+        return 2
+    return machine, drive
+
+
+def running():
+    machine, _ = asynchronous()
+
+    async def cycle(service):
+        # in a running loop the invoke is started as a task
+        service.send('start')
+        while service.machine.current != 'idle':
+            await asyncio.sleep(0)
+
+    def drive(service):
+        asyncio.get_event_loop().run_until_complete(cycle(service))
+        return 2
+    return machine, drive
+
+
+KINDS = {
+    'flat': flat,
+    'immediate': immediates,
+    'invoke': invoked,
+    'pooled invoke': pooled,
+    'async invoke': asynchronous,
+    'task invoke': running,
+}
+
+
+def installed():
+    '''
+    The event loop set for the thread, None if there is none
+    '''
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return asyncio.get_event_loop_policy().get_event_loop()
+    except RuntimeError:
+        return None
+
+
+def counts():
+    result = dict((name, 0) for name in WATCHED)
+    for o in gc.get_objects():
+        name = type(o).__name__
+        if name in result:
+            result[name] += 1
+    return result
+
+
+def sample():
+    gc.collect()
+    # the samples kept by the harness are not counted
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)))
+    retained = sum(stat.size for stat in snapshot.statistics('filename'))
+    return retained, counts()
+
+
+def soak(kind: str, events: int = EVENTS, services: int = SERVICES, samples: int = SAMPLES, budget: int = BUDGET):
+    '''
+    Returns (leaked, report): leaked is a list of the reasons, empty when
+    the retained memory and the objects per service did not grow
+    '''
+    # async invokes run in a loop of their own, closed at the end
+    previous = installed()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # coroutines created and never awaited are reported as a leak
+        with warnings.catch_warnings(record=True) as warned:
+            warnings.simplefilter('always', RuntimeWarning)
+            machine, drive = KINDS[kind]()
+            fleet = [interpret(machine) for _ in range(services)]
+            for service in fleet:
+                drive(service)
+            tracemalloc.start()
+            try:
+                history = []
+                done = 0
+                start = time.perf_counter()
+                for _ in range(samples):
+                    target = done + events // samples
+                    while done < target:
+                        for service in fleet:
+                            done += drive(service)
+                    history.append(sample())
+                took = time.perf_counter() - start
+            finally:
+                tracemalloc.stop()
+            gc.collect()
+    finally:
+        loop.close()
+        asyncio.set_event_loop(previous)
+    # the first sample includes the caches filled by the first events
+    first, last = history[0], history[-1]
+    leaked = []
+    grown = (last[0] - first[0]) / services
+    if grown > budget:
+        leaked.append('%.0f bytes retained per service' % grown)
+    unawaited = len([w for w in warned if w.category is RuntimeWarning and
+                     'never awaited' in str(w.message)])
+    if unawaited:
+        leaked.append('%d coroutines never awaited' % unawaited)
+    for name in WATCHED:
+        if last[1][name] > first[1][name] + services // 10:
+            leaked.append('%d more %s objects' % (last[1][name] - first[1][name], name))
+    report = '%-14s %9d events %6.2f s %+8.1f bytes/service' % (kind, done, took, grown)
+    return leaked, report
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS
+    failed = False
+    for kind in KINDS:
+        leaked, report = soak(kind, events)
+        print(report + ('  LEAK: ' + ', '.join(leaked) if leaked else ''))
+        failed = failed or bool(leaked)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
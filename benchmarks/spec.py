@@ -0,0 +1,65 @@
+'''
+Loading many machine definitions from JSON specs, without cache, filling
+the on-disk cache and with a warm cache.
+
+Run from the repository root:
+    python -m benchmarks.spec
+'''
+import json
+import os
+import tempfile
+import time
+
+from core.spec import loadFile
+
+MACHINES = 300
+STATES = 40
+
+
+def isReady(ctx):
+    return True
+
+
+def keep(ctx):
+    return ctx
+
+
+def spec(n: int):
+    states = dict()
+    for i in range(STATES):
+        states['s' + str(i)] = {
+            'on': {
+                'next': {'target': 's' + str((i + 1) % STATES), 'guard': 'benchmarks.spec.isReady',
+                         'reduce': 'benchmarks.spec.keep'},
+                'reset': 's0',
+                'event' + str(n): ['s' + str((i + 2) % STATES), 's0']
+            },
+            'delay': [{'ms': 1000 * (i + 1), 'target': 's0'}]
+        }
+    return {'initial': 's0', 'states': states}
+
+
+def loadAll(files, cache):
+    start = time.perf_counter()
+    for path in files:
+        loadFile(path, cache)
+    return time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for n in range(MACHINES):
+            path = os.path.join(tmp, 'machine' + str(n) + '.json')
+            with open(path, 'w') as f:
+                json.dump(spec(n), f)
+            files.append(path)
+        cache = os.path.join(tmp, 'cache')
+        print('%d machines of %d states' % (MACHINES, STATES))
+        print('no cache     %8.1f ms' % (loadAll(files, None) * 1000))
+        print('cold cache   %8.1f ms' % (loadAll(files, cache) * 1000))
+        print('warm cache   %8.1f ms' % (loadAll(files, cache) * 1000))
+
+
+if __name__ == '__main__':
+    main()
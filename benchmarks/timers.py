@@ -0,0 +1,53 @@
+'''
+Cost of delayed transitions with many services: every service enters a
+state with a 30s timeout, half of them answer before it and the rest
+time out.
+
+Run from the repository root:
+    python -m benchmarks.timers
+'''
+import time
+import tracemalloc
+
+import core.timers
+from core import createMachine, state, transition, delay, interpret, state as final
+from core.timers import TimerWheel
+
+N = 100000
+
+
+def main():
+    wheel = core.timers.wheel = TimerWheel(resolution=10)
+    machine = createMachine({
+        'idle': state(transition('call', 'waiting')),
+        'waiting': state(delay(30000, 'timeout'), transition('answer', 'done')),
+        'timeout': final(),
+        'done': final()
+    })
+    services = [interpret(machine, lambda: None) for _ in range(N)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for service in services:
+        service.send('call')
+    took = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    print('enter with timeout  %6.2f us/service, %d bytes/service' %
+          (took / N * 1e6, memory / N))
+
+    start = time.perf_counter()
+    for service in services[::2]:
+        service.send('answer')
+    took = time.perf_counter() - start
+    print('leave (cancel)      %6.2f us/service' % (took / (N // 2) * 1e6))
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    wheel.advance(30000)
+    took = time.perf_counter() - start
+    print('30s of ticks        %6.2f ms for %d timeouts' % (took * 1000, N - N // 2))
+    assert all(s.machine.current == 'timeout' for s in services[1::2])
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,11 @@
 from .machine import *
+from . import machine as _machine
+
+
+def __getattr__(name):
+    # invoke and its helpers are imported lazily, see core.machine
+    if name in _machine.lazy:
+        value = globals()[name] = getattr(_machine, name)
+        return value
+    raise AttributeError("module '" + __name__ +
+                         "' has no attribute '" + name + "'")
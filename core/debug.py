@@ -1,6 +1,10 @@
-from typing import Dict
+from __future__ import annotations
 
-from .machine import d, InvokeFn, State
+from .machine import d, Invoke, Parallel, State
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict
 
 
 def unknownState(from_, state):
@@ -18,15 +22,25 @@ def create(current: str, states: Dict[str, State]):
             for c in candidates:
                 if c.to not in states:
                     unknownState(p, c.to)
-        if isinstance(state, InvokeFn):
-            hasErrorFrom = False
-            for candidates in state.transitions.values():
-                for c in candidates:
-                    if c.from_ == 'error':
-                        hasErrorFrom = True
-            if not hasErrorFrom:
-                print('When using invoke [current state: '+p +
-                      '] with Promise-returning function, you need to add \'error\' state. Otherwise, robot will hide errors in Promise-returning function')
+        for c in getattr(state, 'delays', []):
+            if c.to not in states:
+                unknownState(p, c.to)
+        if isinstance(state, (Parallel, Invoke)) and None in state.transitions:
+            # built without nested(), parallel() or invoke()
+            raise Exception('Immediate and delay transitions of state [' + p +
+                            '] are never taken, use state()')
+        if isinstance(state, Invoke):
+            # only reachable once invoke() was used, so this import is free
+            from .invocation import InvokeFn
+            if isinstance(state, InvokeFn):
+                hasErrorFrom = False
+                for candidates in state.transitions.values():
+                    for c in candidates:
+                        if c.from_ == 'error':
+                            hasErrorFrom = True
+                if not hasErrorFrom:
+                    print('When using invoke [current state: '+p +
+                          '] with Promise-returning function, you need to add \'error\' state. Otherwise, robot will hide errors in Promise-returning function')
 
 
 d._create = create
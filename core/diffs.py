@@ -0,0 +1,134 @@
+'''
+Opt-in tracking of the context changes made by each transition:
+
+    track(service)
+    service.send('input')
+    service.changes  # {'title': 'new title'}, DELETED for removed keys
+
+The context is wrapped in a Tracked dict, which records the keys set by
+the reducers (ctx | {...}, ctx[key] = value, update, ...), so computing
+the changes costs as much as the changes, not as the context. Reducers
+returning another kind of dict are diffed entirely.
+'''
+from __future__ import annotations
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from .machine import Service
+
+
+class Deleted:
+    def __repr__(self):
+        return 'DELETED'
+
+
+DELETED = Deleted()
+
+
+class Tracked(dict):
+    '''
+    dict recording the keys it (or the dicts made from it with |) changed
+    '''
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        # None when not recording
+        self.changes = None
+
+    def record(self, keys):
+        if self.changes is not None:
+            self.changes.update(keys)
+
+    def __or__(self, other):
+        result = Tracked(self)
+        dict.update(result, other)
+        if self.changes is not None:
+            result.changes = set(self.changes)
+            result.changes.update(other)
+        return result
+
+    def __ior__(self, other):
+        dict.update(self, other)
+        self.record(other)
+        return self
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.record((key,))
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.record((key,))
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        dict.update(self, other)
+        self.record(other)
+
+    def pop(self, key, *default):
+        self.record((key,))
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self.record((key,))
+        return dict.setdefault(self, key, default)
+
+    def clear(self):
+        self.record(tuple(self))
+        dict.clear(self)
+
+    def copy(self):
+        result = Tracked(self)
+        if self.changes is not None:
+            result.changes = set(self.changes)
+        return result
+
+
+def same(a, b) -> bool:
+    return a is b or a == b
+
+
+class Tracker:
+    def begin(self, service: Service):
+        context = service.context
+        if type(context) is Tracked:
+            context.changes = set()
+
+    def end(self, service: Service, previous):
+        context = service.context
+        if type(context) is Tracked and context.changes is not None:
+            keys = context.changes
+            context.changes = None
+        else:
+            # not made from the tracked context, diff all of it
+            keys = set(previous)
+            keys.update(context)
+            if isinstance(context, dict):
+                service.context = context = Tracked(context)
+        changes = dict()
+        if context is previous:
+            # changed in place, the previous values are gone
+            for key in keys:
+                changes[key] = context[key] if key in context else DELETED
+            service.changes = changes
+            return
+        for key in keys:
+            if key in context:
+                value = context[key]
+                if key not in previous or not same(previous[key], value):
+                    changes[key] = value
+            elif key in previous:
+                changes[key] = DELETED
+        service.changes = changes
+
+
+def track(service: Service):
+    service.tracker = Tracker()
+    service.changes = dict()
+    if type(service.context) is not Tracked:
+        service.context = Tracked(service.context)
+
+
+def untrack(service: Service):
+    service.tracker = None
+    service.changes = None
@@ -0,0 +1,75 @@
+'''
+Files written by core.spec (compiled specs cache) and core.store (evicted
+services). Where marshal is missing (MicroPython) they are written as
+JSON, and os.replace, os.getpid and os.path are not required.
+'''
+from __future__ import annotations
+import json
+import os
+
+try:
+    import marshal as serializer
+except ImportError:
+    serializer = None
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any
+
+EXTENSION = '.marshal' if serializer is not None else '.json'
+
+
+def dump(value: Any) -> bytes:
+    if serializer is not None:
+        return serializer.dumps(value)
+    return json.dumps(value).encode()
+
+
+def undump(data: bytes) -> Any:
+    if serializer is not None:
+        return serializer.loads(data)
+    return json.loads(data)
+
+
+def makeDirectory(path: str):
+    '''
+    Creates the directory and its missing parents
+    '''
+    if exists(path):
+        return
+    parent = path.rstrip('/').rpartition('/')[0]
+    if parent:
+        makeDirectory(parent)
+    try:
+        os.mkdir(path)
+    except OSError:
+        pass
+
+
+def exists(path: str) -> bool:
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+def remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def write(path: str, data: bytes):
+    '''
+    Written aside and renamed, so other processes never read half a file
+    '''
+    tmp = path + '.' + str(os.getpid() if hasattr(os, 'getpid') else 0) + '.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except OSError:
+        remove(tmp)
+        raise
@@ -0,0 +1,172 @@
+'''
+Opt-in, bounded history of the transitions of a service:
+
+    record(service, size=64, every=16)
+    service.send('input')
+    service.history.step(1)  # (state, event, context) one step back
+    service.rewind(1)        # back to it
+
+The last size steps are kept in a ring buffer. Each step stores the
+context changes of its transition (see core.diffs, tracking is enabled by
+record) and a full copy of the context every few steps (keyframes), so
+the memory is proportional to the changes. Contexts are copied shallowly,
+values changed in place are not recorded. Transitions of regions are
+recorded as steps of their nested or parallel state, which can't be
+rewound into (see rewind).
+'''
+from __future__ import annotations
+
+from .diffs import DELETED, Tracked, track
+from .machine import Invoke, Machine, Parallel, exitState, notify
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, Tuple
+    from .machine import Service
+
+
+def patch(context: Dict, changes: Dict):
+    for key in changes:
+        value = changes[key]
+        if value is DELETED:
+            context.pop(key, None)
+        else:
+            context[key] = value
+
+
+class History:
+    '''
+    Ring buffer of (state, event, changes, keyframe) steps, keyframe is the
+    full context after the step or None
+    '''
+
+    def __init__(self, size: int = 64, every: int = 16):
+        if size < 1 or every < 1:
+            raise Exception('size and every must be positive')
+        self.size = size
+        self.every = every
+        self.steps = [None] * size
+        # ring index of the oldest step
+        self.start = 0
+        self.count = 0
+        # context after the oldest step
+        self.base = None
+        # steps since the last keyframe
+        self.since = 0
+
+    def __len__(self):
+        return self.count
+
+    def begin(self, state: str, context: Dict):
+        self.steps[self.start] = (state, None, dict(), None)
+        self.count = 1
+        self.base = dict(context)
+        self.since = 0
+
+    def push(self, state: str, event, changes: Dict, context: Dict):
+        keyframe = None
+        self.since += 1
+        # untracked changes can't be replayed, keep the whole context
+        if changes is None or self.since >= self.every:
+            keyframe = dict(context)
+            self.since = 0
+        size = self.size
+        if self.count == size:
+            # the oldest step is overwritten, the next one becomes the base
+            self.start = (self.start + 1) % size
+            self.count -= 1
+            oldest = self.steps[self.start]
+            if oldest[3] is not None:
+                self.base = dict(oldest[3])
+            else:
+                patch(self.base, oldest[2])
+        self.steps[(self.start + self.count) % size] = (
+            state, event, changes, keyframe)
+        self.count += 1
+
+    def at(self, index: int):
+        return self.steps[(self.start + index) % self.size]
+
+    def step(self, k: int = 0) -> Tuple[str, object, Dict]:
+        '''
+        The (state, event, context) of k steps back, 0 being the current one
+        '''
+        if k < 0 or k >= self.count:
+            raise Exception('%d steps back, only %d recorded' %
+                            (k, self.count))
+        index = self.count - 1 - k
+        first = index
+        while first > 0 and self.at(first)[3] is None:
+            first -= 1
+        keyframe = self.at(first)[3]
+        if keyframe is not None:
+            context = dict(keyframe)
+        else:
+            # the oldest step, replayed from the base
+            context = dict(self.base)
+        for i in range(first + 1, index + 1):
+            patch(context, self.at(i)[2])
+        state, event, changes, keyframe = self.at(index)
+        return state, event, context
+
+    def drop(self, k: int):
+        '''
+        Forgets the k newest steps
+        '''
+        for _ in range(k):
+            self.count -= 1
+            self.steps[(self.start + self.count) % self.size] = None
+        self.since = 0
+        index = self.count - 1
+        while index > 0 and self.at(index)[3] is None:
+            self.since += 1
+            index -= 1
+
+
+def record(service: Service, size: int = 64, every: int = 16) -> History:
+    '''
+    Records the last size transitions of the service, with a keyframe of the
+    context every few steps
+    '''
+    if service.tracker is None:
+        track(service)
+    history = History(size, every)
+    history.begin(service.machine.current, service.context)
+    service.history = history
+    return history
+
+
+def stop(service: Service):
+    service.history = None
+
+
+def rewind(service: Service, k: int = 1):
+    '''
+    Restores the state and context of k steps back and forgets the newer
+    steps. The state is not entered again: its actions, invokes and delays
+    do not run and the active regions and children are exited. Only the
+    state of the service is recorded, so nested, parallel and invoke states
+    (whose regions or children would be lost) can't be rewound into
+    '''
+    history = service.history
+    if history is None:
+        raise Exception('history is not recorded, see core.history.record')
+    state, event, context = history.step(k)
+    machine = service.machine
+    original = machine.original or machine
+    if isinstance(original.states[state], (Parallel, Invoke)):
+        raise Exception('can not rewind into ' + repr(state) +
+                        ', a nested, parallel or invoke state')
+    history.drop(k)
+    exitState(service)
+    if service.registry is not None:
+        service.registry.move(service, original, machine.current, state)
+    service.machine = Machine(current=state,
+                              states=original.states,
+                              context=original.context,
+                              original=original)
+    service.context = Tracked(context) if service.tracker is not None else context
+    if service.tracker is not None:
+        service.changes = dict()
+    notify(service, service)
+    return service
@@ -0,0 +1,406 @@
+from __future__ import annotations
+import asyncio
+
+from . import limits
+from .machine import Event, Fn, Invoke, Machine, Service, createContext, drain, eventTransitions, exitState, interpret, isFinal, notify, transitionTo
+
+try:
+    from inspect import iscoroutinefunction
+except ImportError:
+    # MicroPython, async functions are told apart by what they return
+    def iscoroutinefunction(fn):
+        return False
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List
+
+
+def spawn(coro):
+    '''
+    Schedules the coroutine in the running event loop, or runs it to
+    completion when there is none
+    '''
+    try:
+        loop = asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        asyncio.get_event_loop().run_until_complete(coro)
+        return None
+    return loop.create_task(coro)
+
+
+class InvokeFn(Fn, Invoke):
+
+    def __init__(self, fn: Callable, transitions: Dict, ):
+        Fn.__init__(self, fn=fn)
+        Invoke.__init__(self, transitions=transitions)
+        # async functions are only called by the task that awaits them,
+        # others are probed for a machine to invoke
+        self.coroutine = iscoroutinefunction(fn)
+
+    def enter(self, machine2: Machine, service: Service, event):
+        if not self.coroutine:
+            try:
+                rn = self.fn(service, service.context, event)
+            except TypeError:
+                try:
+                    rn = self.fn(service, service.context)
+                except TypeError:
+                    rn = self.fn()
+            if isinstance(rn, Machine):
+                return InvokeMachine(machine=rn,
+                                     transitions=self.transitions
+                                     ).enter(machine2, service, event)
+            if asyncio.iscoroutine(rn):
+                # made with the probing arguments, fn is called again below
+                rn.close()
+
+        async def doneCallback(fn):
+            limiter = limits.limiter
+            if limiter is not None:
+                await limiter.acquire()
+                if service.machine is not machine2:
+                    # the state was left while waiting
+                    limiter.drop()
+                    return
+            try:
+                try:
+                    result = Event('done', await fn(service.context, event))
+                except Exception as error:
+                    result = Event('error', error=error)
+                # the state was left while running
+                if service.machine is not machine2:
+                    return
+                task = asyncio.current_task()
+                if task in service.tasks:
+                    service.tasks.remove(task)
+                service.send(result)
+            finally:
+                if limiter is not None:
+                    limiter.release()
+
+        # called as a Fn (with the context and event it takes), as the
+        # sources of invokeAll are
+        task = spawn(doneCallback(self))
+        if task is not None and not task.done():
+            service.tasks.append(task)
+
+        return machine2
+
+
+class InvokeMachine(Invoke):
+    def __init__(self, transitions: Dict, machine: Machine, reuse: bool = False):
+        super().__init__(transitions=transitions)
+        self.machine = machine
+        self.pool = poolOf(machine) if reuse else None
+
+    def watch(self, service: Service):
+        def onChange(s: Service):
+            notify(service, s)
+            if service.child == s and isFinal(s.machine):
+                service.child = None
+                service.children.remove(s)
+                service.send(Event('done', s.context))
+        return onChange
+
+    def enter(self, machine: Machine, service: Service, event):
+        if self.pool is not None:
+            return self.enterPooled(machine, service, event)
+        service.child = interpret(
+            self.machine, self.watch(service), service.context, event)
+        if isFinal(service.child.machine):
+            data = service.child.context
+            service.child = None
+            return transitionTo(service, machine, Event('done', data), self.transitions['done'])
+        service.children.append(service.child)
+        return machine
+
+    def enterPooled(self, machine: Machine, service: Service, event):
+        child = self.pool.acquire(service, event)
+        if isFinal(child.machine):
+            data = child.context
+            self.pool.release(child)
+            return transitionTo(service, machine, Event('done', data), self.transitions['done'])
+        service.child = child
+        service.children.append(child)
+        return machine
+
+    def restore(self, service: Service, current: str, context: Dict) -> Service:
+        '''
+        Adds a child already in the current state, without entering it
+        (see core.store)
+        '''
+        definition = self.machine
+        machine = Machine(current=current,
+                          states=definition.states,
+                          context=definition.context,
+                          original=definition)
+        if self.pool is not None:
+            child = Pooled(self.pool, machine, context)
+            child.parent = service
+            self.pool.created += 1
+        else:
+            child = Service(machine=machine, context=context,
+                            onChange=self.watch(service))
+        service.child = child
+        service.children.append(child)
+        return child
+
+
+class Pooled(Service):
+    '''
+    Child service of a pool, reports to the parent that acquired it
+    '''
+
+    def __init__(self, pool, machine: Machine, context: Dict):
+        Service.__init__(self, machine=machine,
+                         context=context, onChange=self.changed)
+        self.pool = pool
+        self.parent = None
+
+    def reset(self, parent: Service, context: Dict):
+        pool = self.pool
+        # back to the state of a new service, keeping the bound onChange
+        Service.__init__(self, machine=pool.machine,
+                         context=context, onChange=self.onChange)
+        self.pool = pool
+        self.parent = parent
+
+    def changed(self, s: Service):
+        parent = self.parent
+        if parent is None:
+            return
+        notify(parent, self)
+        if parent.child is self and isFinal(self.machine):
+            parent.child = None
+            parent.children.remove(self)
+            self.pool.release(self)
+            parent.send(Event('done', self.context))
+
+
+class Pool:
+    '''
+    Idle child services of a machine, reset and reused by
+    invoke(machine, ..., reuse=True) instead of interpreting the machine on
+    every entry. The context factory still runs on every entry
+    '''
+
+    def __init__(self, machine: Machine, limit: int = 64):
+        self.machine = machine
+        self.limit = limit
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, parent: Service, event) -> Service:
+        machine = self.machine
+        context = createContext(machine, parent.context, event)
+        idle = self.idle
+        i = len(idle) - 1
+        # a child finishing is released while it still processes its event
+        while i >= 0 and idle[i].processing:
+            i -= 1
+        if i >= 0:
+            child = idle.pop(i)
+            child.reset(parent, context)
+            self.reused += 1
+        else:
+            child = Pooled(self, machine, context)
+            child.parent = parent
+            self.created += 1
+        # as interpret does, without draining an empty queue
+        child.processing = True
+        child.machine = machine.states[machine.current].enter(
+            machine, child, event)
+        if child.queue:
+            drain(child)
+        else:
+            child.processing = False
+        return child
+
+    def release(self, child: Service):
+        if child.parent is None:
+            return
+        child.parent = None
+        exitState(child)
+        if child.registry is not None:
+            child.registry.remove(child)
+        if len(self.idle) < self.limit:
+            self.idle.append(child)
+
+
+# pools by machine definition, shared by all the states invoking it
+pools = dict()
+
+
+def poolOf(machine: Machine) -> Pool:
+    definition = machine.original or machine
+    pool = pools.get(definition)
+    if pool is None:
+        pool = pools[definition] = Pool(definition)
+    return pool
+
+
+def invoke(fn, *transitions, reuse: bool = False):
+    '''
+    Invokes an async function or a child machine. With reuse, the child
+    services of the machine are recycled from its pool, shared by all the
+    states that invoke it with reuse
+    '''
+    t = eventTransitions('invoke', transitions)
+    if isinstance(fn, Machine):
+        return InvokeMachine(
+            machine=fn,
+            transitions=t,
+            reuse=reuse
+        )
+    else:
+        return InvokeFn(
+            fn=fn,
+            transitions=t
+        )
+
+
+class Join:
+    '''
+    Collects the results of the children started by invokeAll/invokeAny
+    and sends a single done (or error) event to the service
+    '''
+
+    def __init__(self, service: Service, machine: Machine, count: int, any: bool):
+        self.service = service
+        # a new Machine is created on every transition, so this identifies
+        # the state entry that started the children
+        self.machine = machine
+        self.any = any
+        self.results = [None] * count
+        self.pending = count
+        self.errors = 0
+        self.children = []
+        self.tasks = dict()
+        # task running the coroutines, in the tasks of the service
+        self.task = None
+        self.finished = False
+
+    def active(self):
+        return not self.finished and self.service.machine is self.machine
+
+    def resolve(self, index: int, data):
+        if not self.active():
+            return
+        self.results[index] = data
+        self.pending -= 1
+        if self.any:
+            self.finish(Event('done', data), index)
+        elif self.pending == 0:
+            self.finish(Event('done', self.results), index)
+
+    def reject(self, index: int, error):
+        if not self.active():
+            return
+        self.pending -= 1
+        self.errors += 1
+        # invokeAny only fails when every child failed
+        if not self.any or self.errors == len(self.results):
+            self.finish(Event('error', error=error), index)
+
+    def finish(self, event, index: int):
+        self.finished = True
+        for i in self.tasks:
+            if i != index and not self.tasks[i].done():
+                self.tasks[i].cancel()
+        service = self.service
+        # the children still running lose, their timers and tasks are stopped
+        for child in self.children:
+            if child in service.children:
+                service.children.remove(child)
+                exitState(child)
+        if self.task in service.tasks:
+            service.tasks.remove(self.task)
+        service.send(event)
+
+    def watch(self, index: int):
+        def onChange(s: Service):
+            if self.finished:
+                return
+            notify(self.service, s)
+            if isFinal(s.machine) and s in self.service.children:
+                self.service.children.remove(s)
+                self.resolve(index, s.context)
+        return onChange
+
+    async def run(self, index: int, fn: Fn, context, event):
+        limiter = limits.limiter
+        if limiter is not None:
+            await limiter.acquire()
+            if not self.active():
+                limiter.drop()
+                return
+        try:
+            data = await fn(context, event)
+        except Exception as error:
+            self.reject(index, error)
+        else:
+            self.resolve(index, data)
+        finally:
+            if limiter is not None:
+                limiter.release()
+
+    async def runAll(self, coros: Dict):
+        for index in coros:
+            self.tasks[index] = asyncio.create_task(coros[index])
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+class InvokeAll(Invoke):
+    def __init__(self, transitions: Dict, sources: List, any: bool = False):
+        super().__init__(transitions=transitions)
+        self.sources = sources
+        self.any = any
+
+    def enter(self, machine: Machine, service: Service, event):
+        join = Join(service, machine, len(self.sources), self.any)
+        if not self.sources:
+            join.finish(Event('done', None if self.any else []), None)
+            return service.machine
+        fns = []
+        for index in range(len(self.sources)):
+            source = self.sources[index]
+            if isinstance(source, Machine):
+                child = interpret(source, join.watch(index),
+                                  service.context, event)
+                if isFinal(child.machine):
+                    join.resolve(index, child.context)
+                else:
+                    join.children.append(child)
+                    service.children.append(child)
+            else:
+                fns.append(index)
+            if join.finished:
+                return service.machine
+        # the coroutines are only created when they are going to be awaited
+        if fns:
+            coros = dict((index, join.run(index, Fn(self.sources[index]),
+                                          service.context, event))
+                         for index in fns)
+            task = spawn(join.runAll(coros))
+            if task is not None and not task.done():
+                join.task = task
+                service.tasks.append(task)
+        return service.machine
+
+
+def invokeAll(sources: List, *transitions):
+    '''
+    Runs child machines and async functions concurrently, the done event
+    data is the list of their results (children contexts or returned values)
+    '''
+    return InvokeAll(sources=sources, transitions=eventTransitions('invokeAll', transitions))
+
+
+def invokeAny(sources: List, *transitions):
+    '''
+    Like invokeAll, but done is sent with the result of the first source to
+    finish. The error event is only sent when all of them failed
+    '''
+    return InvokeAll(sources=sources, transitions=eventTransitions('invokeAny', transitions), any=True)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from .machine import Deferred, Service, nameOf, process
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+
+class Lane:
+    '''
+    FIFO of (service, event), optionally bounded: when full the oldest
+    event is shed
+    '''
+    __slots__ = ('items', 'head', 'limit', 'shed')
+
+    def __init__(self, limit: int = None):
+        self.items = []
+        self.head = 0
+        self.limit = limit
+        self.shed = 0
+
+    def __len__(self):
+        return len(self.items) - self.head
+
+    def push(self, entry: tuple):
+        self.items.append(entry)
+        if self.limit is not None and len(self) > self.limit:
+            event = self.pop()[1]
+            if isinstance(event, Deferred):
+                event.drop()
+            self.shed += 1
+
+    def pop(self) -> tuple:
+        items = self.items
+        entry = items[self.head]
+        items[self.head] = None
+        self.head += 1
+        if self.head == len(items):
+            del items[:]
+            self.head = 0
+        elif self.head > 32 and self.head * 2 > len(items):
+            del items[:self.head]
+            self.head = 0
+        return entry
+
+
+class Lanes:
+    '''
+    Queue of a service split in priority lanes, lane 0 first. Events are
+    put in the lane of their name (priorities), or in the default one (the
+    last). Lanes with a limit shed their oldest events when full.
+
+        service.lanes = Lanes(3, {'cancel': 0, 'error': 0}, limits=[None, None, 1000])
+    '''
+
+    def __init__(self, count: int = 3, priorities: Dict[str, int] = None, default: int = None, limits: List[int] = None):
+        self.lanes = [Lane(limits[i] if limits is not None else None)
+                      for i in range(count)]
+        self.priorities = priorities or dict()
+        self.default = count - 1 if default is None else default
+
+    def __len__(self):
+        count = 0
+        for lane in self.lanes:
+            count += len(lane)
+        return count
+
+    @property
+    def shed(self) -> List[int]:
+        '''
+        Events shed so far, by lane
+        '''
+        return [lane.shed for lane in self.lanes]
+
+    def push(self, service: Service, event):
+        self.lanes[self.priorities.get(nameOf(event), self.default)].push(
+            (service, event))
+
+    def pop(self) -> tuple:
+        for lane in self.lanes:
+            if len(lane):
+                return lane.pop()
+        return None
+
+    def run(self, root: Service, limit: int = None) -> int:
+        # the backlog is made of independent events, unlike the plain
+        # queue it is kept when one of them raises
+        root.processing = True
+        count = 0
+        try:
+            while count != limit:
+                entry = self.pop()
+                if entry is None:
+                    break
+                count += 1
+                service, event = entry
+                if isinstance(event, Deferred):
+                    event = event.take()
+                    if event is None:
+                        continue
+                process(service, event)
+        finally:
+            root.processing = False
+        return count
@@ -0,0 +1,156 @@
+'''
+Shared limit on the async work started by invoke, invokeAll and invokeAny:
+
+    limit(concurrency=100, rate=500)
+
+At most concurrency coroutines run at once and at most rate start per
+second (with bursts of up to burst). The others wait in a single FIFO
+queue, so the services are served in the order they entered their invoke
+states. Invokes whose state was left while they waited are dropped
+without being started.
+'''
+from __future__ import annotations
+import asyncio
+from collections import deque
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict
+
+
+class Limiter:
+    def __init__(self, concurrency: int = None, rate: float = None, burst: int = None):
+        if concurrency is None and rate is None:
+            raise Exception('concurrency or rate is required')
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate or 1))
+        self.tokens = self.burst
+        self.updated = None
+        self.running = 0
+        # (future, queued at) in arrival order
+        self.waiters = deque()
+        self.timer = None
+        # metrics
+        self.started = 0
+        self.dropped = 0
+        self.queued = 0
+        self.waited = 0.0
+        self.maxWait = 0.0
+        self.maxDepth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.waiters)
+
+    def stats(self) -> Dict:
+        return {'running': self.running,
+                'depth': len(self.waiters),
+                'maxDepth': self.maxDepth,
+                'started': self.started,
+                'dropped': self.dropped,
+                'meanWait': self.waited / self.queued if self.queued else 0.0,
+                'maxWait': self.maxWait}
+
+    def refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        if self.concurrency is not None and self.running >= self.concurrency:
+            return False
+        if self.rate is not None:
+            self.refill(now)
+            return self.tokens >= 1
+        return True
+
+    def start(self):
+        self.running += 1
+        self.started += 1
+        if self.rate is not None:
+            self.tokens -= 1
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self.waiters and self.available(now):
+            self.start()
+            return
+        future = loop.create_future()
+        self.waiters.append((future, now))
+        self.queued += 1
+        if len(self.waiters) > self.maxDepth:
+            self.maxDepth = len(self.waiters)
+        self.schedule(loop)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # cancelled after being woken, give the slot back
+                self.release()
+            else:
+                # the state was left while waiting
+                self.dropped += 1
+            raise
+
+    def release(self):
+        self.running -= 1
+        self.wake()
+
+    def drop(self):
+        '''
+        Releases the slot of an invoke that was not started
+        '''
+        self.dropped += 1
+        self.started -= 1
+        self.release()
+
+    def wake(self):
+        if not self.waiters:
+            return
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        waiters = self.waiters
+        while waiters and self.available(now):
+            future, queued = waiters.popleft()
+            if future.cancelled():
+                continue
+            wait = now - queued
+            self.waited += wait
+            if wait > self.maxWait:
+                self.maxWait = wait
+            self.start()
+            future.set_result(None)
+        self.schedule(loop)
+
+    def schedule(self, loop):
+        # nothing running to release a slot, wait for the next token
+        if self.rate is None or not self.waiters or self.timer is not None:
+            return
+        if self.tokens >= 1:
+            return
+        self.timer = loop.call_later((1 - self.tokens) / self.rate, self.tick)
+
+    def tick(self):
+        self.timer = None
+        self.wake()
+
+
+# shared by every service, None for no limit
+limiter = None
+
+
+def limit(concurrency: int = None, rate: float = None, burst: int = None) -> Limiter:
+    '''
+    Limits the invoked coroutines of all the services
+    '''
+    global limiter
+    limiter = Limiter(concurrency, rate, burst)
+    return limiter
+
+
+def unlimit():
+    global limiter
+    limiter = None
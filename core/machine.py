@@ -1,6 +1,13 @@
-from typing import Any, Callable, List, Dict, Union
+from __future__ import annotations
 import sys
-import asyncio
+
+from . import timers
+
+# typing is only needed by type checkers, importing it at runtime costs
+# startup time on CPython and requires a stub package on MicroPython
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable, List, Dict, Union
 
 
 class Debugger:
@@ -15,6 +22,39 @@ def empty(): return dict()
 
 identity: Callable = lambda *x: x[0]
 
+# event names are interned so the lookups in the transitions maps compare
+# by identity, MicroPython already interns them as qstrs
+intern: Callable = getattr(sys, 'intern', identity)
+
+
+class Event:
+    '''
+    Event with a name (type) and optional data or error. Can also be read
+    as a dictionary event: ev['data'], ev.get('data'), 'error' in ev
+    '''
+    __slots__ = ('type', 'data', 'error')
+
+    def __init__(self, type: str, data: Any = None, error: Any = None):
+        self.type = intern(type)
+        self.data = data
+        self.error = error
+
+    def __getitem__(self, key: str):
+        if key in Event.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key: str):
+        # as the dict events had only the keys they were given
+        return key in Event.__slots__ and getattr(self, key) is not None
+
+    def get(self, key: str, default: Any = None):
+        value = getattr(self, key) if key in Event.__slots__ else None
+        return default if value is None else value
+
+    def __repr__(self):
+        return 'Event(' + repr(self.type) + ')'
+
 
 def filter(Type, arr):
     return [x for x in arr if isinstance(x, Type)]
@@ -88,6 +128,10 @@ class Immediate(Transition):
     pass
 
 
+class Delay(Transition):
+    pass
+
+
 def transition(*args):
     return makeTransition(Transition, *args)
 
@@ -96,25 +140,71 @@ def immediate(*args):
     return makeTransition(Immediate, None, *args)
 
 
+def delay(ms: int, *args):
+    t = makeTransition(Delay, None, *args)
+    t.ms = ms
+    return t
+
+
 class State:
-    def __init__(self, enter: Callable = identity, transitions: Dict[str, List[Transition]] = {}, final: bool = False, immediates: List[Immediate] = []):
+    def __init__(self, enter: Callable = identity, transitions: Dict[str, List[Transition]] = {}, final: bool = False, immediates: List[Immediate] = [], delays: List[Delay] = []):
         self.enter = enter
         self.transitions = transitions
         self.final = final
         self.immediates = immediates
+        self.delays = delays
 
 
 def state(*args: Transition):
-    transitions = filter(Transition, args)
+    transitions = [t for t in filter(Transition, args)
+                   if not isinstance(t, Delay)]
     immediates = filter(Immediate, args)
+    delays = filter(Delay, args)
     desc = State(final=len(args) == 0,
                  transitions=transitionToMap(transitions))
+    if len(delays) > 0:
+        desc.delays = delays
+        desc.enter = lambda *args: enterDelayed(desc, *args)
     if len(immediates) > 0:
         desc.immediates = immediates
         desc.enter = lambda *args: enterImmediate(desc, *args)
     return desc
 
 
+class Parallel(State):
+    def __init__(self, regions: Dict[str, Machine], transitions: Dict[str, List[Transition]]):
+        State.__init__(self, enter=self.enterRegions, transitions=transitions)
+        self.regions = regions
+        # event name -> names of the regions that handle it, see createMachine
+        self.routes = {}
+
+    def enterRegions(self, machine: Machine, service: Service, event):
+        regions = dict()
+        for name in self.regions:
+            regions[name] = Region(service, name, self.regions[name], event)
+        service.regions = regions
+        if allFinal(regions) and 'done' in self.transitions:
+            return transitionTo(service, machine, Event('done', service.context), self.transitions['done']) or machine
+        return machine
+
+
+class Nested(Parallel):
+    def __init__(self, machine: Machine, transitions: Dict[str, List[Transition]]):
+        # the single region is named after the state, known in createMachine
+        super().__init__(regions={}, transitions=transitions)
+        self.machine = machine
+
+
+def nested(machine: Machine, *transitions: Transition):
+    return Nested(machine=machine,
+                  transitions=eventTransitions('nested', transitions))
+
+
+def parallel(regions: Dict[str, Machine], *transitions: Transition):
+    return Parallel(regions=regions,
+                    transitions=eventTransitions('parallel', transitions))
+
+
 class MachineDef:
     def __init__(self, name: str, value: State):
         self.name = name
@@ -142,150 +232,396 @@ def createMachine(current: Union[str, Dict], states: Union[Dict[str, State], Cal
         current = list(states.keys())[0]
     if hasattr(d, '_create'):
         d._create(current, states)
+    indexEvents(states)
     return Machine(current=current,
                    states=states,
                    context=contextFn)
 
 
+def indexEvents(states: Dict[str, State]):
+    '''
+    Builds the routing table of every nested/parallel state, so an event is
+    only dispatched to the regions that have a transition for it, and
+    returns the event names handled anywhere in this machine
+    '''
+    events = set()
+    for name in states:
+        state = states[name]
+        events.update(state.transitions)
+        if isinstance(state, Nested):
+            state.regions = {name: state.machine}
+        if isinstance(state, Parallel):
+            routes = dict()
+            for region in state.regions:
+                for ev in indexEvents(state.regions[region].states):
+                    if ev not in routes:
+                        routes[ev] = []
+                    routes[ev].append(region)
+            state.routes = routes
+            events.update(routes)
+    return events
+
+
+def isFinal(machine: Machine):
+    value = machine.state.value
+    return isinstance(value, State) and value.final
+
+
+def allFinal(regions: Dict[str, Service]):
+    for name in regions:
+        if not isFinal(regions[name].machine):
+            return False
+    return True
+
+
 class Service:
     def __init__(self, machine: Machine, context: Dict, onChange: Callable, child=None):
         self.machine = machine
         self.context = context
         self.onChange = onChange
         self.child = None
+        self.children = []
+        self.regions = None
+        # pending delayed transitions of the current state
+        self.timers = []
+        # running tasks of the async invokes of the current state
+        self.tasks = []
+        # timer wheel for delayed transitions, the shared one if None
+        self.wheel = None
+        # run-to-completion queue of (service, event), regions use the one
+        # of the service they belong to (root)
+        self.root = self
+        self.queue = []
+        self.processing = False
+        # core.registry.Registry the service was added to
+        self.registry = None
+        # selective listeners, see subscribe
+        self.subscriptions = None
+        # event name -> policy applied before sending, see core.policies
+        self.policies = None
+        # core.lanes.Lanes replacing the queue, by priority of the events
+        self.lanes = None
+        # context changes of the last transition, when tracked (core.diffs)
+        self.tracker = None
+        self.changes = None
+        # core.invocation.Pool the child service is returned to on exit
+        self.pool = None
+        # core.history.History of the last transitions, when recorded
+        self.history = None
 
     def send(self, event):
         send(self, event)
 
+    def post(self, event):
+        '''
+        Queues the event without processing it, see run
+        '''
+        post(self, event)
+
+    def run(self, limit: int = None) -> int:
+        '''
+        Processes the queued events, up to limit. Returns how many
+        '''
+        if self.root.processing:
+            return 0
+        return drain(self.root, limit)
+
+    def subscribe(self, fn: Callable, states: List[str] = None, events: List[str] = None, keys: List[str] = None):
+        '''
+        Calls fn(service) after the transitions to one of the states, caused
+        by one of the events and/or changing one of the context keys. Returns
+        the subscription, call its unsubscribe() to stop
+        '''
+        from .subscriptions import subscribe
+        return subscribe(self, fn, states, events, keys)
+
+    def rewind(self, k: int = 1):
+        '''
+        Restores the state and context of k transitions ago, see core.history
+        '''
+        from .history import rewind
+        return rewind(self, k)
+
+
+class Region(Service):
+    '''
+    Active region of a nested or parallel state. It shares the context of
+    its parent and reports changes as changes of the parent
+    '''
+
+    def __init__(self, parent: Service, name: str, machine: Machine, event, enter: bool = True):
+        self.parent = parent
+        self.name = name
+        Service.__init__(self, machine=machine,
+                         context=parent.context, onChange=self.changed)
+        self.root = parent.root
+        # restored regions (core.store) are already in their state
+        if enter:
+            self.machine = machine.state.value.enter(machine, self, event)
 
-def interpret(machine: Machine, onChange: Callable, initialContext: Dict = {}, event=None):
+    @property
+    def context(self):
+        return self.parent.context
+
+    @context.setter
+    def context(self, value):
+        self.parent.context = value
+
+    def changed(self, s: Service = None):
+        parent = self.parent
+        notify(parent, parent)
+        regions = parent.regions
+        if regions is not None and regions.get(self.name) is self and isFinal(self.machine) and allFinal(regions):
+            state = parent.machine.state.value
+            if 'done' in state.transitions:
+                transitionTo(parent, parent.machine, Event('done', parent.context), state.transitions['done'])
+
+
+def notify(service: Service, changed: Service):
+    if service.onChange is None:
+        return
     try:
-        context = machine.context(initialContext, event)
+        service.onChange(changed)
+    except TypeError:
+        service.onChange()
+
+
+def createContext(machine: Machine, initialContext: Dict, event):
+    try:
+        return machine.context(initialContext, event)
     except TypeError:
         try:
-            context = machine.context(initialContext)
+            return machine.context(initialContext)
         except TypeError:
-            context = machine.context()
+            return machine.context()
+
+
+def interpret(machine: Machine, onChange: Callable = None, initialContext: Dict = {}, event=None):
     s = Service(
         machine=machine,
-        context=context,
+        context=createContext(machine, initialContext, event),
         onChange=onChange
     )
+    # events sent while entering the initial state wait for it
+    s.processing = True
     s.machine = s.machine.state.value.enter(s.machine, s, event)
+    drain(s)
     return s
 
 
 def send(service: Service, event):
-    if hasattr(event, 'type'):
-        eventName = event.type
-    elif hasattr(event, '__getitem__'):
-        eventName = event['type']
+    if service.policies is not None:
+        policy = service.policies.get(nameOf(event))
+        if policy is not None:
+            return policy.send(service, event)
+    return deliver(service, event)
+
+
+def deliver(service: Service, event):
+    '''
+    Events sent while the service (or the service its region belongs to) is
+    processing another event are queued and run after it, so sends from
+    actions, onChange or children never run inside a transition
+    '''
+    root = service.root
+    enqueue(root, service, event)
+    if not root.processing:
+        drain(root)
+    return service.machine
+
+
+def post(service: Service, event):
+    root = service.root
+    processing = root.processing
+    # while processing, send (and the policies) only queue events
+    root.processing = True
+    try:
+        send(service, event)
+    finally:
+        root.processing = processing
+
+
+def enqueue(root: Service, service: Service, event):
+    if root.lanes is not None:
+        root.lanes.push(service, event)
     else:
-        eventName = event
+        root.queue.append((service, event))
+
+
+def drain(root: Service, limit: int = None) -> int:
+    if root.lanes is not None:
+        return root.lanes.run(root, limit)
+    root.processing = True
+    queue = root.queue
+    i = 0
+    caused = len(queue)
+    try:
+        while i < len(queue) and i != limit:
+            service, event = queue[i]
+            queue[i] = None
+            i += 1
+            caused = len(queue)
+            if isinstance(event, Deferred):
+                event = event.take()
+                if event is None:
+                    continue
+            process(service, event)
+    except BaseException:
+        # only the events queued by the failed one are dropped, those sent
+        # or posted before it stay queued (as in lanes) for the next run
+        for entry in queue[caused:]:
+            if isinstance(entry[1], Deferred):
+                entry[1].drop()
+        del queue[caused:]
+        raise
+    finally:
+        del queue[:i]
+        root.processing = False
+    return i
+
+
+class Deferred:
+    '''
+    Queued in place of an event that is only known when it is processed.
+    Subclasses define take(), which returns that event (None when there is
+    nothing left to process), and drop(), called instead of take when the
+    entry is discarded (shed by lanes or left over after an error)
+    '''
+
+
+def nameOf(event) -> str:
+    # plain strings and Event are the common cases, avoid probing them
+    t = type(event)
+    if t is str:
+        return event
+    elif t is Event:
+        return event.type
+    elif hasattr(event, 'type'):
+        return event.type
+    elif hasattr(event, '__getitem__'):
+        return event['type']
+    return event
+
+
+def process(service: Service, event):
+    eventName = nameOf(event)
+    if not dispatch(service, eventName, event) and hasattr(d, '_send') and not handles(service, eventName):
+        d._send(eventName, service.machine.current)
+
+
+def dispatch(service: Service, eventName: str, event) -> bool:
+    '''
+    Sends the event to the active regions that handle it, innermost first,
+    falling back to the transitions of the state itself. Returns True if a
+    transition was taken
+    '''
     machine = service.machine
     state = machine.state.value
-    currentStateName = machine.state.name
-
+    regions = service.regions
+    if regions is not None and eventName in state.routes:
+        taken = False
+        for name in state.routes[eventName]:
+            # a region can finish the parent state while handling the event
+            if service.regions is not regions:
+                return True
+            if dispatch(regions[name], eventName, event):
+                taken = True
+        if taken:
+            return True
     if eventName in state.transitions:
-        return transitionTo(service, machine, event, state.transitions.get(eventName)) or machine
-    else:
-        if hasattr(d, '_send'):
-            d._send(eventName, currentStateName)
-    return machine
+        return transitionTo(service, machine, event, state.transitions[eventName]) is not None
+    return False
+
+
+def handles(service: Service, eventName: str) -> bool:
+    state = service.machine.state.value
+    return eventName in state.transitions or (service.regions is not None and eventName in state.routes)
 
 
 def transitionToMap(transitions: List[Transition]) -> Dict[str, Transition]:
     m = dict()
     for t in transitions:
+        if t.from_ is not None:
+            t.from_ = intern(t.from_)
         if not t.from_ in m:
             m[t.from_] = []
         m[t.from_].append(t)
     return m
 
 
-def enterImmediate(self, machine: Machine, service: Service, event: Dict):
-    return transitionTo(service, machine, event, self.immediates) or machine
+def eventTransitions(kind: str, transitions: List[Transition]) -> Dict[str, Transition]:
+    '''
+    transitionToMap for the states that are only left by events
+    '''
+    for t in transitions:
+        if isinstance(t, (Immediate, Delay)):
+            raise Exception(kind + ' states have no immediate or delay transitions')
+    return transitionToMap(transitions)
 
 
-class Invoke:
-    def __init__(self, transitions: Dict):
-        self.transitions = transitions
+def enterImmediate(self, machine: Machine, service: Service, event: Dict):
+    return transitionTo(service, machine, event, self.immediates) or enterDelayed(self, machine, service, event)
 
 
-class InvokeFn(Fn, Invoke):
+def wheelOf(service: Service) -> timers.TimerWheel:
+    return service.wheel if service.wheel is not None else timers.wheel
 
-    def __init__(self, fn: Callable, transitions: Dict, ):
-        Fn.__init__(self, fn=fn)
-        Invoke.__init__(self, transitions=transitions)
 
-    def enter(self, machine2: Machine, service: Service, event):
-        try:
-            rn = self.fn(service, service.context, event)
-        except TypeError:
-            try:
-                rn = self.fn(service, service.context)
-            except TypeError:
-                rn = self.fn()
-        if isinstance(rn, Machine):
-            return InvokeMachine(machine=rn,
-                                 transitions=self.transitions
-                                 ).enter(machine2, service, event)
+def enterDelayed(self, machine: Machine, service: Service, event: Dict):
+    wheel = wheelOf(service)
+    for t in self.delays:
+        service.timers.append(wheel.schedule(
+            t.ms, fireDelayed, service, machine, t))
+    return machine
 
-        async def doneCallback(fn):
-            try:
-                data = await fn(service.context, event)
-                service.send({'type': 'done', 'data': data})
-            except Exception as error:
-                service.send({'type': 'error', 'error': error})
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(doneCallback(self.fn))
+def fireDelayed(service: Service, machine: Machine, t: Delay):
+    # run in turn with the events, sends from its actions are queued after it
+    root = service.root
+    enqueue(root, service, Fired(service, machine, t))
+    if not root.processing:
+        drain(root)
 
-        return machine2
 
+class Fired(Deferred):
+    '''
+    Delayed transition waiting in the queue, taken in its turn
+    '''
+    type = 'delay'
 
-class InvokeMachine(Invoke):
-    def __init__(self, transitions: Dict, machine: Machine):
-        super().__init__(transitions=transitions)
+    def __init__(self, service: Service, machine: Machine, t: Delay):
+        self.service = service
         self.machine = machine
+        self.t = t
 
-    def enter(self, machine: Machine, service: Service, event):
-        def onChange(s: Service):
-            try:
-                service.onChange(s)
-            except TypeError:
-                service.onChange()
-            if service.child == s and isinstance(s.machine.state.value, State) and s.machine.state.value.final:
-                service.child = None
-                service.send({'type': 'done', 'data': s.context})
-        service.child = interpret(
-            self.machine, onChange, service.context, event)
-        if isinstance(service.child.machine.state.value, State) and service.child.machine.state.value.final:
-            data = service.child.context
-            service.child = None
-            return transitionTo(service, machine, {'type': 'done', 'data': data}, self.transitions['done'])
-        return machine
+    def take(self):
+        # timers are cancelled when leaving the state, but service.machine
+        # can also be replaced without a transition
+        if self.service.machine is self.machine:
+            transitionTo(self.service, self.machine,
+                         Event('delay', self.t.ms), [self.t])
+        return None
 
+    def drop(self):
+        pass
 
-def invoke(fn, *transitions):
-    t = transitionToMap(transitions)
-    if isinstance(fn, Machine):
-        return InvokeMachine(
-            machine=fn,
-            transitions=t
-        )
-    else:
-        return InvokeFn(
-            fn=fn,
-            transitions=t
-        )
+
+class Invoke:
+    def __init__(self, transitions: Dict):
+        self.transitions = transitions
 
 
 def transitionTo(service: Service, machine: Machine, fromEvent, candidates: List[Transition]):
     context = service.context
     for c in candidates:
         if c.guards(service.context, fromEvent):
+            # regions change the context of the service they belong to
+            tracker = service.root.tracker
+            if tracker is not None:
+                tracker.begin(service.root)
             service.context = c.reducers(service, service.context, fromEvent)
+            if tracker is not None:
+                tracker.end(service.root, context)
 
             original = machine.original or machine
             newMachine = Machine(current=c.to,
@@ -296,9 +632,70 @@ def transitionTo(service: Service, machine: Machine, fromEvent, candidates: List
             if hasattr(d, '_onEnter'):
                 d._onEnter(machine, c.to, service.context, context, fromEvent)
             state = newMachine.state.value
+            exitState(service)
+            if service.registry is not None:
+                service.registry.move(service, original,
+                                      machine.current, c.to)
             service.machine = newMachine
-            try:
-                service.onChange(service)
-            except TypeError:
-                service.onChange()
+            root = service.root
+            if root.history is not None:
+                root.history.push(root.machine.current, fromEvent,
+                                  root.changes, root.context)
+            # before onChange: the onChange of a region can take its parent
+            # to a done transition
+            publish(service, c.to, nameOf(fromEvent), context)
+            notify(service, service)
             return state.enter(newMachine, service, fromEvent)
+
+
+def publish(service: Service, state: str, event: str, previous):
+    '''
+    Calls the subscriptions of the service, and those of the services its
+    regions belong to (up to the root) as onChange does
+    '''
+    while True:
+        if service.subscriptions is not None:
+            service.subscriptions.notify(service, state, event, previous)
+        if not isinstance(service, Region):
+            return
+        service = service.parent
+
+
+def exitState(service: Service):
+    if service.timers:
+        for timer in service.timers:
+            timer.cancel()
+        service.timers = []
+    if service.tasks:
+        for task in service.tasks:
+            task.cancel()
+        service.tasks = []
+    if service.children:
+        for child in service.children:
+            if child.pool is not None:
+                child.pool.release(child)
+            else:
+                exitState(child)
+        service.children = []
+    service.child = None
+    regions = service.regions
+    if regions is not None:
+        service.regions = None
+        for name in regions:
+            exitState(regions[name])
+
+
+# the invoke helpers live in core.invocation, which pulls in asyncio: they
+# are only imported the first time one of their names is looked up
+lazy = ('invoke', 'invokeAll', 'invokeAny',
+        'InvokeFn', 'InvokeMachine', 'InvokeAll')
+
+
+def __getattr__(name):
+    if name in lazy:
+        from . import invocation
+        for n in lazy:
+            globals()[n] = getattr(invocation, n)
+        return globals()[name]
+    raise AttributeError("module '" + __name__ +
+                         "' has no attribute '" + name + "'")
@@ -0,0 +1,131 @@
+'''
+Policies for bursts of events of the same name, applied by send before
+the event reaches the service:
+
+- coalesce: while the service is busy, only the latest pending event is kept
+- debounce: the latest event is sent once no other came for some time
+- throttle: at most some events per second, the latest of the rest is sent
+  when the next one is allowed
+
+Debounce and throttle use the timer wheel of the service (core.timers).
+Each policy has send(service, event) and dropped, the count of the events
+that never reached the service.
+'''
+from __future__ import annotations
+
+from .machine import Deferred, Service, deliver, enqueue, wheelOf
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, Union
+
+
+class Coalesce(Deferred):
+    def __init__(self, type: str):
+        self.dropped = 0
+        # queued in place of the events, the name gives their priority lane
+        self.type = type
+        self.latest = None
+        self.queued = False
+
+    def send(self, service: Service, event):
+        root = service.root
+        if not root.processing:
+            return deliver(service, event)
+        if self.queued:
+            self.dropped += 1
+        else:
+            self.queued = True
+            enqueue(root, service, self)
+        self.latest = event
+        return service.machine
+
+    def take(self):
+        event = self.latest
+        self.latest = None
+        self.queued = False
+        return event
+
+    def drop(self):
+        self.take()
+
+
+class Debounce:
+    def __init__(self, ms: int):
+        self.dropped = 0
+        self.ms = ms
+        self.latest = None
+        self.timer = None
+
+    def send(self, service: Service, event):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.dropped += 1
+        self.latest = event
+        self.timer = wheelOf(service).schedule(self.ms, self.fire, service)
+        return service.machine
+
+    def fire(self, service: Service):
+        event = self.latest
+        self.latest = None
+        self.timer = None
+        deliver(service, event)
+
+
+class Throttle:
+    def __init__(self, perSecond: float):
+        self.dropped = 0
+        self.interval = 1000 / perSecond
+        self.latest = None
+        self.pending = False
+        self.timer = None
+
+    def send(self, service: Service, event):
+        if self.timer is None:
+            self.timer = wheelOf(service).schedule(
+                self.interval, self.fire, service)
+            return deliver(service, event)
+        if self.pending:
+            self.dropped += 1
+        self.latest = event
+        self.pending = True
+        return service.machine
+
+    def fire(self, service: Service):
+        if not self.pending:
+            self.timer = None
+            return
+        event = self.latest
+        self.latest = None
+        self.pending = False
+        self.timer = wheelOf(service).schedule(
+            self.interval, self.fire, service)
+        deliver(service, event)
+
+
+def policies(service: Service) -> Dict[str, Union[Coalesce, Debounce, Throttle]]:
+    if service.policies is None:
+        service.policies = dict()
+    return service.policies
+
+
+def coalesce(service: Service, *names: str):
+    for name in names:
+        policies(service)[name] = Coalesce(name)
+
+
+def debounce(service: Service, name: str, ms: int) -> Debounce:
+    policy = policies(service)[name] = Debounce(ms)
+    return policy
+
+
+def throttle(service: Service, name: str, perSecond: float) -> Throttle:
+    policy = policies(service)[name] = Throttle(perSecond)
+    return policy
+
+
+def clear(service: Service, name: str):
+    if service.policies is not None and name in service.policies:
+        del service.policies[name]
+        if not service.policies:
+            service.policies = None
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from .machine import Machine, Service
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List
+
+
+def definition(service: Service) -> Machine:
+    return service.machine.original or service.machine
+
+
+class Registry:
+    '''
+    Live services indexed by state name and machine definition (the
+    machine returned by createMachine). Services are moved between the
+    indexes by transitionTo, so looking up the services in a state only
+    touches those services
+    '''
+
+    def __init__(self):
+        # state name -> machine definition -> set of services
+        self.states = dict()
+
+    def __len__(self):
+        count = 0
+        for byMachine in self.states.values():
+            for services in byMachine.values():
+                count += len(services)
+        return count
+
+    def add(self, service: Service):
+        if service.registry is not None:
+            service.registry.remove(service)
+        service.registry = self
+        self.index(service, definition(service), service.machine.current)
+        return service
+
+    def remove(self, service: Service):
+        if service.registry is self:
+            service.registry = None
+            self.unindex(service, definition(service),
+                         service.machine.current)
+
+    def index(self, service: Service, machine: Machine, name: str):
+        byMachine = self.states.get(name)
+        if byMachine is None:
+            byMachine = self.states[name] = dict()
+        services = byMachine.get(machine)
+        if services is None:
+            services = byMachine[machine] = set()
+        services.add(service)
+
+    def unindex(self, service: Service, machine: Machine, name: str):
+        byMachine = self.states[name]
+        services = byMachine[machine]
+        services.discard(service)
+        if not services:
+            del byMachine[machine]
+            if not byMachine:
+                del self.states[name]
+
+    def move(self, service: Service, machine: Machine, previous: str, current: str):
+        self.unindex(service, machine, previous)
+        self.index(service, machine, current)
+
+    def services(self, name: str, machine: Machine = None) -> List[Service]:
+        '''
+        Services currently in the state, of any machine unless one is given
+        '''
+        byMachine = self.states.get(name)
+        if byMachine is None:
+            return []
+        if machine is not None:
+            return list(byMachine.get(machine, ()))
+        found = []
+        for services in byMachine.values():
+            found.extend(services)
+        return found
+
+    def broadcast(self, name: str, event, machine: Machine = None) -> int:
+        '''
+        Sends the event to the services in the state, returns how many
+        '''
+        services = self.services(name, machine)
+        for service in services:
+            service.send(event)
+        return len(services)
+
+    def countByState(self, machine: Machine = None) -> Dict[str, int]:
+        counts = dict()
+        for name in self.states:
+            byMachine = self.states[name]
+            if machine is None:
+                count = 0
+                for services in byMachine.values():
+                    count += len(services)
+            else:
+                count = len(byMachine.get(machine, ()))
+            if count:
+                counts[name] = count
+        return counts
+
+
+# default registry, services are only tracked once added
+registry = Registry()
@@ -0,0 +1,269 @@
+'''
+Optional asyncio server hosting services by key, and its client:
+
+    server = Server({'door': interpret(door)})
+    await server.start(port=8000)          # or path='/tmp/machines.sock'
+
+    client = Client(port=8000)
+    await client.send('door', 'open')      # 'opened'
+    await client.batch([('door', 'close'), ('door', {'type': 'lock', 'data': 1234})])
+
+Frames are a 4 bytes big endian length followed by a JSON object. A request
+is {"id": n, "sends": [[key, event], ...]}, events are names or
+{"type": name, "data": ...} objects. The reply is {"id": n, "states": [...]}
+with the state of each service after its send, in order (null when it
+failed, with "errors": [[index, message], ...]). Requests are processed in
+the order they are received and can be pipelined: a client writes new
+requests without waiting for the replies of the previous ones.
+'''
+from __future__ import annotations
+import asyncio
+import json
+import struct
+
+from .machine import Event
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Tuple
+    from .machine import Service
+
+header = struct.Struct('>I')
+
+
+def frame(message: Dict) -> bytes:
+    data = json.dumps(message, separators=(',', ':')).encode()
+    return header.pack(len(data)) + data
+
+
+async def readFrame(reader: asyncio.StreamReader, limit: int):
+    '''
+    The next message, None at the end of the stream
+    '''
+    try:
+        size = header.unpack(await reader.readexactly(header.size))[0]
+    except asyncio.IncompleteReadError:
+        return None
+    if size > limit:
+        raise Exception('frame of %d bytes over the limit of %d' %
+                        (size, limit))
+    return json.loads(await reader.readexactly(size))
+
+
+def decode(event):
+    if type(event) is str:
+        return event
+    return Event(event['type'], event.get('data'))
+
+
+class Server:
+    '''
+    Hosts services by key. services is a dict, or any object with get(key),
+    factory(key) creates the service of an unknown key when given
+    '''
+
+    def __init__(self, services: Dict[str, Service] = None, factory: Callable = None, limit: int = 1 << 24):
+        self.services = services if services is not None else dict()
+        self.factory = factory
+        # largest accepted frame, in bytes
+        self.limit = limit
+        self.server = None
+        # handler task -> writer of the open connections
+        self.connections = dict()
+
+    def add(self, key: str, service: Service):
+        self.services[key] = service
+        return service
+
+    def service(self, key: str) -> Service:
+        service = self.services.get(key)
+        if service is None:
+            if self.factory is None:
+                raise Exception('unknown service ' + repr(key))
+            service = self.services[key] = self.factory(key)
+        return service
+
+    def apply(self, sends: List) -> Dict:
+        states = []
+        errors = None
+        for i in range(len(sends)):
+            key, event = sends[i]
+            try:
+                service = self.service(key)
+                service.send(decode(event))
+                states.append(service.machine.current)
+            except Exception as error:
+                states.append(None)
+                if errors is None:
+                    errors = []
+                errors.append([i, str(error)])
+        reply = {'states': states}
+        if errors is not None:
+            reply['errors'] = errors
+        return reply
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                request = await readFrame(reader, self.limit)
+                if request is None:
+                    break
+                reply = self.apply(request['sends'])
+                reply['id'] = request['id']
+                writer.write(frame(reply))
+                # only waits when the client does not read its replies
+                await writer.drain()
+        except Exception:
+            # lost connection or malformed request, the client gets the
+            # connection closed
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str = None):
+        '''
+        Listens on a TCP port (0 picks a free one, see port) or on a Unix
+        socket when path is given
+        '''
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        tasks = list(self.connections)
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+
+class Connection:
+    '''
+    Client connection, replies are matched to the pending requests by id
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, limit: int):
+        self.reader = reader
+        self.writer = writer
+        self.limit = limit
+        self.next = 0
+        # request id -> future of the reply
+        self.pending = dict()
+        self.closed = False
+        self.task = asyncio.get_running_loop().create_task(self.read())
+
+    def request(self, sends: List) -> asyncio.Future:
+        if self.closed:
+            raise Exception('connection closed')
+        id = self.next
+        self.next += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[id] = future
+        self.writer.write(frame({'id': id, 'sends': sends}))
+        return future
+
+    async def read(self):
+        error = Exception('connection closed')
+        try:
+            while True:
+                reply = await readFrame(self.reader, self.limit)
+                if reply is None:
+                    break
+                future = self.pending.pop(reply['id'], None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except Exception as e:
+            error = e
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def close(self):
+        self.closed = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.task
+
+
+class Client:
+    '''
+    Pool of up to size connections to a Server, opened on first use.
+    Requests are spread over the connections and pipelined on each one
+    '''
+
+    def __init__(self, host: str = '127.0.0.1', port: int = None, path: str = None, size: int = 4, limit: int = 1 << 24):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.size = size
+        self.limit = limit
+        self.connections = []
+        # tasks opening connections
+        self.opening = []
+        self.next = 0
+
+    async def open(self) -> Connection:
+        if self.path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        return Connection(reader, writer, self.limit)
+
+    async def connection(self) -> Connection:
+        self.connections = [c for c in self.connections if not c.closed]
+        if len(self.connections) + len(self.opening) < self.size:
+            task = asyncio.ensure_future(self.open())
+            self.opening.append(task)
+            task.add_done_callback(self.opened)
+        elif self.connections:
+            self.next = (self.next + 1) % len(self.connections)
+            return self.connections[self.next]
+        else:
+            # all the connections are being opened, wait for one of them
+            self.next = (self.next + 1) % len(self.opening)
+            task = self.opening[self.next]
+        # the connection is opened even if this request is cancelled, its
+        # error is raised to all the requests waiting for it
+        return await asyncio.shield(task)
+
+    def opened(self, task: asyncio.Task):
+        self.opening.remove(task)
+        if not task.cancelled() and task.exception() is None:
+            self.connections.append(task.result())
+
+    async def batch(self, sends: List[Tuple[str, object]]) -> List[str]:
+        '''
+        Sends the events to the services of their keys, returns their states.
+        Raises the first error
+        '''
+        connection = await self.connection()
+        reply = await connection.request([[key, event] for key, event in sends])
+        if 'errors' in reply:
+            index, message = reply['errors'][0]
+            raise Exception('%s (send %d)' % (message, index))
+        return reply['states']
+
+    async def send(self, key: str, event) -> str:
+        return (await self.batch([(key, event)]))[0]
+
+    async def close(self):
+        connections = self.connections
+        self.connections = []
+        for connection in connections:
+            await connection.close()
@@ -0,0 +1,322 @@
+'''
+Machines from declarative specs (dicts or JSON), with functions referenced
+by dotted import path:
+
+    {
+        "initial": "idle",
+        "context": "app.machines.initialContext",
+        "states": {
+            "idle": {"on": {"edit": {"target": "editing", "reduce": "app.machines.keepTitle"}}},
+            "editing": {
+                "on": {"save": [{"target": "saved", "guard": "app.machines.isValid"}, "idle"]},
+                "delay": [{"ms": 30000, "target": "idle"}]
+            },
+            "saving": {"invoke": "app.machines.save", "on": {"done": "saved", "error": "idle"}},
+            "saved": {"final": true}
+        }
+    }
+
+A transition is a target name or a dict with target and optional guard,
+reduce and action (a path or a list of paths), "on" maps event names to
+one or a list of transitions, "immediate" and "delay" are lists. States can
+also be "nested" (a spec) or "parallel" (region name -> spec), these and
+"invoke" states only take "on" transitions.
+
+Specs are validated and normalized (compiled) once, the compiled form can
+be cached on disk keyed by the hash of the spec, so later loads skip
+parsing and validation. The cache only saves that part: every load still
+imports the functions and builds the states and transitions. Specs that
+compile faster than a compiled spec is read from the cache are not
+written to it.
+'''
+from __future__ import annotations
+import json
+
+from .files import EXTENSION, dump, makeDirectory, undump, write
+from .machine import Transition, Immediate, Delay, createMachine, empty, state, reduce, action, guard, nested, parallel, stackGuards, stackReducers
+from .timers import ticks_diff, ticks_us
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Union
+    from .machine import Machine
+
+# bump when the compiled format changes, it is part of the cache key
+VERSION = '1'
+
+STATE_KEYS = ('on', 'immediate', 'delay', 'invoke',
+              'nested', 'parallel', 'final')
+TRANSITION_KEYS = ('target', 'guard', 'reduce', 'action', 'ms')
+
+
+def specError(path: str, message: str):
+    raise Exception('Invalid machine spec [' + path + ']: ' + message)
+
+
+def paths(value, where: str) -> List[str]:
+    if value is None:
+        return []
+    if type(value) is str:
+        value = [value]
+    for p in value:
+        if type(p) is not str or '.' not in p:
+            specError(where, 'expected a dotted import path, got ' + repr(p))
+    return list(value)
+
+
+def compileTransition(spec, states: Dict, where: str, delayed: bool = False) -> tuple:
+    if type(spec) is str:
+        spec = {'target': spec}
+    if type(spec) is not dict:
+        specError(where, 'a transition is a target name or a dict')
+    for key in spec:
+        if key not in TRANSITION_KEYS:
+            specError(where, 'unknown transition key ' + repr(key))
+    target = spec.get('target')
+    if target not in states:
+        specError(where, 'unknown target state ' + repr(target))
+    fns = []
+    for kind in ('guard', 'reduce', 'action'):
+        for p in paths(spec.get(kind), where + '.' + kind):
+            fns.append((kind, p))
+    if delayed:
+        ms = spec.get('ms')
+        if type(ms) is not int or ms < 0:
+            specError(where, 'delay needs a positive ms')
+        return (target, fns, ms)
+    return (target, fns)
+
+
+def compileTransitions(specs, states: Dict, where: str, delayed: bool = False) -> List[tuple]:
+    if specs is None:
+        return []
+    if type(specs) is not list:
+        specs = [specs]
+    return [compileTransition(specs[i], states, where + '[' + str(i) + ']', delayed)
+            for i in range(len(specs))]
+
+
+def compileSpec(spec: Dict, where: str = 'machine') -> Dict:
+    '''
+    Validates the spec and returns its compiled (normalized) form, made
+    only of dicts, lists, tuples and strings
+    '''
+    if type(spec) is not dict or type(spec.get('states')) is not dict or not spec['states']:
+        specError(where, 'a machine spec needs a dict of states')
+    states = spec['states']
+    initial = spec.get('initial')
+    if initial is None:
+        initial = next(iter(states))
+    if initial not in states:
+        specError(where, 'initial state ' + repr(initial) + ' is not a known state')
+    compiled = dict()
+    for name in states:
+        desc = states[name] or {}
+        at = where + '.' + name
+        if type(desc) is not dict:
+            specError(at, 'a state is a dict')
+        for key in desc:
+            if key not in STATE_KEYS:
+                specError(at, 'unknown state key ' + repr(key))
+        on = desc.get('on') or {}
+        if type(on) is not dict:
+            specError(at + '.on', 'expected a dict of event names')
+        c = {
+            'on': [(event, compileTransitions(on[event], states, at + '.on.' + event)) for event in on],
+            'immediate': compileTransitions(desc.get('immediate'), states, at + '.immediate'),
+            'delay': compileTransitions(desc.get('delay'), states, at + '.delay', True),
+            'final': bool(desc.get('final')),
+        }
+        if 'invoke' in desc:
+            if type(desc['invoke']) is dict:
+                c['invoke'] = compileSpec(desc['invoke'], at + '.invoke')
+            else:
+                c['invoke'] = paths(desc['invoke'], at + '.invoke')[0]
+        if 'nested' in desc:
+            c['nested'] = compileSpec(desc['nested'], at + '.nested')
+        if 'parallel' in desc:
+            regions = desc['parallel']
+            if type(regions) is not dict or not regions:
+                specError(at + '.parallel', 'expected a dict of region specs')
+            c['parallel'] = [(region, compileSpec(regions[region], at + '.parallel.' + region))
+                             for region in regions]
+        if c['final'] and (c['on'] or c['immediate'] or c['delay']):
+            specError(at, 'a final state has no transitions')
+        for kind in ('invoke', 'nested', 'parallel'):
+            if kind in c and (c['immediate'] or c['delay']):
+                specError(at, kind + ' states have no immediate or delay transitions')
+        compiled[name] = c
+    context = spec.get('context')
+    return {
+        'initial': initial,
+        'context': paths(context, where + '.context')[0] if context is not None else None,
+        'states': compiled,
+    }
+
+
+modules = dict()
+
+
+def resolve(path: str) -> Any:
+    '''
+    Imports the object from its dotted path, module.name
+    '''
+    i = path.rindex('.')
+    name = path[:i]
+    module = modules.get(name)
+    if module is None:
+        module = modules[name] = __import__(name, None, None, (path[i + 1:],))
+    return getattr(module, path[i + 1:])
+
+
+FNS = {'guard': guard, 'reduce': reduce, 'action': action}
+# wrapped functions by (kind, path), they are stateless so transitions share them
+wrapped = dict()
+
+
+def fn(kind: str, path: str):
+    key = (kind, path)
+    f = wrapped.get(key)
+    if f is None:
+        f = wrapped[key] = FNS[kind](resolve(path))
+    return f
+
+
+# stacked guards and reducers by their functions, shared by all the
+# transitions with the same ones (most often none)
+stacks = dict()
+
+
+def buildTransition(Type, from_, c: tuple):
+    # same as makeTransition, without scanning the arguments by type
+    key = tuple((k, p) for k, p in c[1])
+    stack = stacks.get(key)
+    if stack is None:
+        stack = stacks[key] = (stackGuards([fn(k, p) for k, p in key if k == 'guard']),
+                               stackReducers([fn(k, p) for k, p in key if k != 'guard']))
+    return Type(from_=from_,
+                to=c[0],
+                guards=stack[0],
+                reducers=stack[1])
+
+
+def build(compiled: Dict) -> Machine:
+    '''
+    Creates the machine of a compiled spec
+    '''
+    states = dict()
+    for name in compiled['states']:
+        c = compiled['states'][name]
+        args = []
+        for event, candidates in c['on']:
+            for t in candidates:
+                args.append(buildTransition(Transition, event, t))
+        for t in c['immediate']:
+            args.append(buildTransition(Immediate, None, t))
+        for t in c['delay']:
+            d = buildTransition(Delay, None, t)
+            d.ms = t[2]
+            args.append(d)
+        if 'invoke' in c:
+            from .invocation import invoke
+            source = c['invoke']
+            states[name] = invoke(build(source) if type(source) is dict else resolve(source),
+                                  *args)
+        elif 'nested' in c:
+            states[name] = nested(build(c['nested']), *args)
+        elif 'parallel' in c:
+            states[name] = parallel({region: build(spec) for region, spec in c['parallel']},
+                                    *args)
+        else:
+            states[name] = state(*args)
+    context = compiled['context']
+    return createMachine(compiled['initial'], states,
+                         resolve(context) if context is not None else empty)
+
+
+def digest(data: bytes) -> str:
+    import hashlib
+    return ''.join('%02x' % b for b in hashlib.sha1(VERSION.encode() + data).digest())
+
+
+def order(spec: Dict) -> List:
+    '''
+    Names of the states and regions in their order, which matters (first
+    state, routing order of the regions) but is lost by a sorted dump
+    '''
+    states = spec.get('states')
+    if type(states) is not dict:
+        return []
+    result = [list(states)]
+    for name in states:
+        desc = states[name]
+        if type(desc) is not dict:
+            continue
+        for key in ('invoke', 'nested'):
+            if type(desc.get(key)) is dict:
+                result.append(order(desc[key]))
+        regions = desc.get('parallel')
+        if type(regions) is dict:
+            result.append(list(regions))
+            for region in regions:
+                if type(regions[region]) is dict:
+                    result.append(order(regions[region]))
+    return result
+
+
+# microseconds to read a compiled spec from the cache, the last one measured
+readCost = 50
+
+
+def compileCached(data: bytes, cache: str, spec: Dict = None) -> Dict:
+    '''
+    Compiles the spec (the JSON data when not given), or reads it compiled
+    from the cache directory, data is the cache key
+    '''
+    global readCost
+    path = cache + '/' + digest(data) + EXTENSION
+    start = ticks_us()
+    try:
+        with open(path, 'rb') as f:
+            compiled = undump(f.read())
+        readCost = ticks_diff(ticks_us(), start)
+        return compiled
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    start = ticks_us()
+    compiled = compileSpec(spec if spec is not None else json.loads(data))
+    if ticks_diff(ticks_us(), start) < readCost:
+        # reading it would cost more than compiling it again
+        return compiled
+    makeDirectory(cache)
+    try:
+        write(path, dump(compiled))
+    except OSError:
+        # the cache is only an optimization, e.g. on a read-only directory
+        pass
+    return compiled
+
+
+def load(spec: Union[Dict, str, bytes], cache: str = None) -> Machine:
+    '''
+    Creates a machine from a spec dict or JSON text. With a cache
+    directory the compiled spec is stored there and reused while the spec
+    does not change
+    '''
+    if type(spec) is dict:
+        if cache is None:
+            return build(compileSpec(spec))
+        # the key does not depend on the order of the keys, but it keeps
+        # the order of the states, which is compiled as given
+        key = json.dumps([spec, order(spec)], sort_keys=True).encode()
+        return build(compileCached(key, cache, spec))
+    if type(spec) is str:
+        spec = spec.encode()
+    if cache is None:
+        return build(compileSpec(json.loads(spec)))
+    return build(compileCached(spec, cache))
+
+
+def loadFile(path: str, cache: str = None) -> Machine:
+    with open(path, 'rb') as f:
+        return load(f.read(), cache)
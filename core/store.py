@@ -0,0 +1,230 @@
+'''
+Services by key with a bounded set in memory:
+
+    store = Store(device, '/var/lib/devices', capacity=10000, idle=60000)
+    store.send('sensor-42', 'reading')
+    store.get('sensor-42').machine.current
+
+The services used last are kept in memory (the hot set), up to capacity
+and while used in the last idle milliseconds. The others are saved to the
+directory (their state and context, with those of their invoked child
+and active regions) and dropped, they are restored on their next use
+without entering their states again. Services waiting for a delayed
+transition, an async invoke, queued events (also in lanes) or debounced
+and throttled events are kept in memory.
+
+Only the state and context are saved: listeners, policies, lanes,
+history and registries are not. The idle services are evicted when the
+store is used, call trim() to evict them otherwise. Contexts are saved
+with marshal (JSON where it is not available, see core.files), they can
+only hold basic values.
+'''
+from __future__ import annotations
+
+from .files import EXTENSION, dump, exists, makeDirectory, remove, undump, write
+from .machine import Invoke, Machine, Region, Service, interpret
+from .timers import ticks_diff, ticks_ms
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Dict
+
+
+def plain(context):
+    # tracked contexts (core.diffs) are dict subclasses
+    if isinstance(context, dict) and type(context) is not dict:
+        return dict(context)
+    return context
+
+
+def snapshot(service: Service, context: bool = True) -> Dict:
+    s = {'state': service.machine.current}
+    if context:
+        # regions share the context of their parent
+        s['context'] = plain(service.context)
+    if service.child is not None:
+        s['child'] = snapshot(service.child)
+    if service.regions is not None:
+        s['regions'] = dict((name, snapshot(service.regions[name], False))
+                            for name in service.regions)
+    return s
+
+
+def attach(service: Service, s: Dict):
+    '''
+    Restores the invoked child and the regions of the snapshot
+    '''
+    state = service.machine.state.value
+    if 'regions' in s:
+        regions = dict()
+        for name in s['regions']:
+            definition = state.regions[name]
+            machine = Machine(current=s['regions'][name]['state'],
+                              states=definition.states,
+                              context=definition.context,
+                              original=definition)
+            regions[name] = Region(service, name, machine, None, enter=False)
+            attach(regions[name], s['regions'][name])
+        service.regions = regions
+    if 'child' in s:
+        child = state.restore(service, s['child']['state'], s['child']['context'])
+        attach(child, s['child'])
+
+
+def restore(definition: Machine, s: Dict, onChange: Callable = None) -> Service:
+    '''
+    The service of the snapshot, in its state without entering it
+    '''
+    service = Service(machine=Machine(current=s['state'],
+                                      states=definition.states,
+                                      context=definition.context,
+                                      original=definition),
+                      context=s['context'],
+                      onChange=onChange)
+    attach(service, s)
+    return service
+
+
+def busy(service: Service) -> bool:
+    '''
+    True when the service would lose work by being dropped
+    '''
+    if service.queue or service.tasks:
+        return True
+    if service.lanes is not None and len(service.lanes):
+        return True
+    for timer in service.timers:
+        if timer.pending:
+            return True
+    if service.policies is not None:
+        # debounced or throttled events wait in the timers of the policies
+        for name in service.policies:
+            timer = getattr(service.policies[name], 'timer', None)
+            if timer is not None and timer.pending:
+                return True
+    state = service.machine.state.value
+    if isinstance(state, Invoke):
+        from .invocation import InvokeMachine
+        if not isinstance(state, InvokeMachine):
+            return True
+    if service.child is not None and busy(service.child):
+        return True
+    if service.regions is not None:
+        for name in service.regions:
+            if busy(service.regions[name]):
+                return True
+    return False
+
+
+def fileName(key: str) -> str:
+    import hashlib
+    return ''.join('%02x' % b for b in hashlib.sha1(key.encode()).digest())
+
+
+class Store:
+    '''
+    Services of a machine by key, see the module docstring. idle is in
+    milliseconds, capacity and idle can be None for no limit
+    '''
+
+    def __init__(self, machine: Machine, path: str, capacity: int = None, idle: int = None, onChange: Callable = None):
+        self.machine = machine.original or machine
+        self.path = path
+        self.capacity = capacity
+        self.idle = idle
+        self.onChange = onChange
+        # key -> service, least recently used first
+        self.hot = dict()
+        # key -> ticks_ms of the last use
+        self.used = dict()
+        self.evicted = 0
+        self.restored = 0
+        makeDirectory(path)
+
+    def __len__(self):
+        return len(self.hot)
+
+    def __contains__(self, key: str):
+        return key in self.hot or exists(self.file(key))
+
+    def __getitem__(self, key: str):
+        return self.get(key)
+
+    def __setitem__(self, key: str, service: Service):
+        self.hot.pop(key, None)
+        self.hot[key] = service
+        self.used[key] = ticks_ms()
+        self.trim(key)
+
+    def file(self, key: str) -> str:
+        return self.path + '/' + fileName(key) + EXTENSION
+
+    def get(self, key: str) -> Service:
+        '''
+        The service of the key, restored or created if not in memory
+        '''
+        service = self.hot.pop(key, None)
+        if service is None:
+            service = self.load(key)
+        self.hot[key] = service
+        self.used[key] = ticks_ms()
+        self.trim(key)
+        return service
+
+    def send(self, key: str, event):
+        service = self.get(key)
+        service.send(event)
+        return service
+
+    def load(self, key: str) -> Service:
+        path = self.file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return interpret(self.machine, self.onChange)
+        remove(path)
+        self.restored += 1
+        return restore(self.machine, undump(data), self.onChange)
+
+    def save(self, key: str, service: Service):
+        write(self.file(key), dump(snapshot(service)))
+
+    def evict(self, key: str) -> bool:
+        '''
+        Saves the service of the key and drops it from memory, unless busy
+        '''
+        service = self.hot.get(key)
+        if service is None or busy(service):
+            return False
+        self.save(key, service)
+        if service.registry is not None:
+            service.registry.remove(service)
+        del self.hot[key]
+        del self.used[key]
+        self.evicted += 1
+        return True
+
+    def trim(self, keep: str = None):
+        '''
+        Evicts the least recently used services over the capacity or idle,
+        except keep (the service being used)
+        '''
+        hot = self.hot
+        now = ticks_ms()
+        # busy services count as used, each service is seen at most once
+        for _ in range(len(hot)):
+            key = next(iter(hot))
+            over = self.capacity is not None and len(hot) > self.capacity
+            if not over and (self.idle is None or ticks_diff(now, self.used[key]) < self.idle):
+                return
+            if key == keep or not self.evict(key):
+                hot[key] = hot.pop(key)
+                self.used[key] = now
+
+    def flush(self):
+        '''
+        Evicts all the services that are not busy, e.g. before exiting
+        '''
+        for key in list(self.hot):
+            self.evict(key)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Iterable, List
+    from .machine import Service
+
+
+def asSet(names):
+    if names is None:
+        return None
+    if type(names) is str:
+        return {names}
+    return set(names)
+
+
+def get(context, key):
+    if hasattr(context, 'get'):
+        return context.get(key)
+    return getattr(context, key, None)
+
+
+def changed(previous, context, key) -> bool:
+    a = get(previous, key)
+    b = get(context, key)
+    return a is not b and a != b
+
+
+class Subscription:
+    def __init__(self, subscriptions: Subscriptions, fn: Callable, states: set, events: set, keys: set):
+        self.subscriptions = subscriptions
+        self.fn = fn
+        self.states = states
+        self.events = events
+        self.keys = keys
+
+    def matches(self, state: str, event: str, previous, context, changes: Dict) -> bool:
+        if self.states is not None and state not in self.states:
+            return False
+        if self.events is not None and event not in self.events:
+            return False
+        if self.keys is not None:
+            for key in self.keys:
+                if key in changes if changes is not None else changed(previous, context, key):
+                    return True
+            return False
+        return True
+
+    def unsubscribe(self):
+        self.subscriptions.remove(self)
+
+
+class Subscriptions:
+    '''
+    Listeners of a service indexed by the most selective of their filters
+    (target states, then event names, then context keys), so a transition
+    only looks at the listeners that can be interested in it
+    '''
+
+    def __init__(self):
+        self.byState = dict()
+        self.byEvent = dict()
+        self.byKey = dict()
+        self.all = []
+
+    def indexOf(self, subscription: Subscription):
+        if subscription.states is not None:
+            return self.byState, subscription.states
+        if subscription.events is not None:
+            return self.byEvent, subscription.events
+        if subscription.keys is not None:
+            return self.byKey, subscription.keys
+        return None, None
+
+    def add(self, subscription: Subscription):
+        index, names = self.indexOf(subscription)
+        if index is None:
+            self.all.append(subscription)
+            return
+        for name in names:
+            if name not in index:
+                index[name] = []
+            index[name].append(subscription)
+
+    def remove(self, subscription: Subscription):
+        index, names = self.indexOf(subscription)
+        if index is None:
+            if subscription in self.all:
+                self.all.remove(subscription)
+            return
+        for name in names:
+            listeners = index.get(name)
+            if listeners is not None and subscription in listeners:
+                listeners.remove(subscription)
+                if not listeners:
+                    del index[name]
+
+    def candidates(self, state: str, event: str, previous, context, changes: Dict) -> List[Subscription]:
+        found = list(self.all)
+        if state in self.byState:
+            found.extend(self.byState[state])
+        if event in self.byEvent:
+            found.extend(self.byEvent[event])
+        if self.byKey:
+            # with tracked changes (core.diffs) only the changed keys are looked at
+            if changes is not None:
+                keys = [key for key in changes if key in self.byKey]
+            else:
+                keys = [key for key in self.byKey if changed(previous, context, key)]
+            for key in keys:
+                for subscription in self.byKey[key]:
+                    if subscription not in found:
+                        found.append(subscription)
+        return found
+
+    def notify(self, service: Service, state: str, event: str, previous):
+        context = service.context
+        changes = service.root.changes
+        for subscription in self.candidates(state, event, previous, context, changes):
+            if subscription.matches(state, event, previous, context, changes):
+                subscription.fn(service)
+
+
+def subscribe(service: Service, fn: Callable, states: Iterable[str] = None, events: Iterable[str] = None, keys: Iterable[str] = None) -> Subscription:
+    if service.subscriptions is None:
+        service.subscriptions = Subscriptions()
+    subscription = Subscription(service.subscriptions, fn,
+                                asSet(states), asSet(events), asSet(keys))
+    service.subscriptions.add(subscription)
+    return subscription
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff  # MicroPython
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_us():
+        return int(monotonic() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable
+
+BITS = 6
+SLOTS = 1 << BITS
+MASK = SLOTS - 1
+LEVELS = 4
+
+
+class Timer:
+    __slots__ = ('due', 'fn', 'args', 'slot')
+
+    def __init__(self, due: int, fn: Callable, args: tuple):
+        self.due = due
+        self.fn = fn
+        self.args = args
+        self.slot = None
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.remove(self)
+            self.slot = None
+
+    @property
+    def pending(self):
+        return self.slot is not None
+
+
+class TimerWheel:
+    '''
+    Hierarchical timer wheel: LEVELS wheels of SLOTS slots, each level
+    counting SLOTS times slower than the previous one. Scheduling and
+    cancelling are O(1), timers of the upper levels are moved down
+    (cascaded) when the lower level wraps around.
+
+    Time only moves with advance(ms), poll() advances it with the clock
+    and run() polls it from an asyncio task
+    '''
+
+    def __init__(self, resolution: int = 10):
+        self.resolution = resolution
+        self.now = 0
+        self.wheels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        # timers further than the last level can hold
+        self.overflow = set()
+        self.last = ticks_ms()
+
+    def __len__(self):
+        count = len(self.overflow)
+        for wheel in self.wheels:
+            for slot in wheel:
+                count += len(slot)
+        return count
+
+    def schedule(self, ms: int, fn: Callable, *args) -> Timer:
+        ticks = int(-(-ms // self.resolution))
+        timer = Timer(self.now + (ticks if ticks > 0 else 1), fn, args)
+        self.place(timer)
+        return timer
+
+    def place(self, timer: Timer):
+        delta = timer.due - self.now
+        for level in range(LEVELS):
+            if delta < 1 << (BITS * (level + 1)):
+                slot = self.wheels[level][(timer.due >> (BITS * level)) & MASK]
+                break
+        else:
+            slot = self.overflow
+        slot.add(timer)
+        timer.slot = slot
+
+    def cascade(self, level: int):
+        if level == LEVELS:
+            timers = self.overflow
+            self.overflow = set()
+        else:
+            index = (self.now >> (BITS * level)) & MASK
+            timers = self.wheels[level][index]
+            self.wheels[level][index] = set()
+        for timer in timers:
+            self.place(timer)
+
+    def tick(self):
+        self.now += 1
+        now = self.now
+        # cascade the upper levels that wrapped around, outermost first
+        level = 1
+        while level <= LEVELS and now & ((1 << (BITS * level)) - 1) == 0:
+            level += 1
+        while level > 1:
+            level -= 1
+            self.cascade(level)
+        index = now & MASK
+        timers = self.wheels[0][index]
+        if timers:
+            self.wheels[0][index] = set()
+            # callbacks can cancel timers of this same slot
+            while timers:
+                timer = timers.pop()
+                timer.slot = None
+                timer.fn(*timer.args)
+
+    def advance(self, ms: int):
+        for _ in range(ms // self.resolution):
+            self.tick()
+
+    def poll(self):
+        '''
+        Fires the timers due since the last poll, to be called from the
+        main loop of synchronous programs
+        '''
+        now = ticks_ms()
+        elapsed = ticks_diff(now, self.last)
+        if elapsed >= self.resolution:
+            self.last = now - elapsed % self.resolution
+            self.advance(elapsed)
+
+    async def run(self):
+        '''
+        Polls the wheel forever, asyncio.create_task(wheel.run())
+        '''
+        import asyncio
+        while True:
+            await asyncio.sleep(self.resolution / 1000)
+            self.poll()
+
+
+# shared by all services, unless they have their own (service.wheel)
+wheel = TimerWheel()
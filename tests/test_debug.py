@@ -1,4 +1,5 @@
-from core import createMachine, state, transition, interpret, d
+from core import createMachine, state, transition, delay, interpret, d
+from core.machine import Nested, transitionToMap
 import unittest
 unittest.TestLoader.sortTestMethodsUsing = None
 
@@ -28,6 +29,17 @@ class TestDebug(unittest.TestCase):
         self.assertTrue("unknown state" in str(context.exception),
                         'Gets an error about unknown states')
 
+    def test_untaken_delay(self):
+        '''
+        Errors for delays of nested states, they would never be taken
+        '''
+        inner = createMachine({'one': state()})
+        with self.assertRaises(Exception) as context:
+            createMachine({
+                'box': Nested(inner, transitionToMap([delay(100, 'box')]))
+            })
+        self.assertIn('never taken', str(context.exception))
+
     def test_state_existent(self):
         '''
         Does not error for transitions to states when state does exist
@@ -0,0 +1,185 @@
+import unittest
+
+import core.timers
+from core import createMachine, state, transition, delay, invoke, guard, reduce, action, interpret, parallel, state as final
+from core.timers import TimerWheel
+
+
+class TestDelay(unittest.TestCase):
+    def setUp(self):
+        self.default = core.timers.wheel
+        self.wheel = core.timers.wheel = TimerWheel(resolution=10)
+
+    def tearDown(self):
+        core.timers.wheel = self.default
+
+    def test_delay(self):
+        '''
+        Transitions after the delay
+        '''
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': state(delay(1000, 'three',
+                               reduce(lambda ctx, ev: ctx | {'after': ev.data}))),
+            'three': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.wheel.advance(990)
+        self.assertEqual(service.machine.current, 'two', 'not yet')
+        self.wheel.advance(10)
+        self.assertEqual(service.machine.current, 'three', 'after 1s')
+        self.assertEqual(service.context['after'], 1000, 'delay in the event')
+        self.assertEqual(len(self.wheel), 0, 'no pending timers')
+
+    def test_service_wheel(self):
+        '''
+        Services can use their own timer wheel
+        '''
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': state(delay(100, 'three')),
+            'three': final()
+        })
+        own = TimerWheel(resolution=10)
+
+        service = interpret(machine, lambda: {})
+        service.wheel = own
+        service.send('go')
+        self.assertEqual(len(self.wheel), 0, 'not in the shared wheel')
+        own.advance(100)
+        self.assertEqual(service.machine.current, 'three')
+
+    def test_cancel_on_exit(self):
+        '''
+        Leaving the state cancels its delays
+        '''
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': state(delay(100, 'timeout'), transition('answer', 'three')),
+            'three': state(transition('go', 'two')),
+            'timeout': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertEqual(len(self.wheel), 1)
+        service.send('answer')
+        self.assertEqual(len(self.wheel), 0, 'cancelled')
+        self.wheel.advance(200)
+        self.assertEqual(service.machine.current, 'three')
+        service.send('go')
+        self.wheel.advance(100)
+        self.assertEqual(service.machine.current, 'timeout', 'scheduled again')
+
+    def test_first_delay_wins(self):
+        '''
+        Delays with guards, the first enabled one wins
+        '''
+        machine = createMachine({
+            'one': state(delay(50, 'two', guard(lambda: False)),
+                         delay(100, 'three'),
+                         delay(200, 'four')),
+            'two': final(),
+            'three': final(),
+            'four': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        self.wheel.advance(1000)
+        self.assertEqual(service.machine.current, 'three')
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_region_delay(self):
+        '''
+        Delays work inside regions and are cancelled with them
+        '''
+        blink = createMachine({
+            'on': state(delay(500, 'off')),
+            'off': state(delay(500, 'on'))
+        })
+        machine = createMachine({
+            'blinking': parallel({'led': blink}, transition('stop', 'stopped')),
+            'stopped': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        self.wheel.advance(500)
+        self.assertEqual(service.regions['led'].machine.current, 'off')
+        self.wheel.advance(500)
+        self.assertEqual(service.regions['led'].machine.current, 'on')
+        service.send('stop')
+        self.assertEqual(len(self.wheel), 0, 'region timers cancelled')
+
+    def test_send_from_action(self):
+        '''
+        Events sent by the actions of a delayed transition run after it
+        '''
+        services = []
+        machine = createMachine({
+            'a': state(delay(100, 'b', action(lambda: services[0].send('x')))),
+            'b': state(transition('x', 'c')),
+            'c': final()
+        })
+        services.append(interpret(machine))
+        self.wheel.advance(100)
+        self.assertEqual(services[0].machine.current, 'c')
+
+
+    def test_child_exited(self):
+        '''
+        Timers of an invoked child are cancelled when the parent leaves its state
+        '''
+        changes = []
+        child = createMachine({
+            'waiting': state(delay(100, 'late')),
+            'late': state()
+        })
+        machine = createMachine({
+            'running': invoke(child, transition('cancel', 'stopped')),
+            'stopped': state()
+        })
+        service = interpret(machine, lambda s: changes.append(s))
+        service.send('cancel')
+        changes.clear()
+        self.assertEqual(len(self.wheel), 0, 'no pending timers')
+        self.wheel.advance(200)
+        self.assertListEqual(changes, [])
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_levels(self):
+        '''
+        Timers in the upper levels fire at their time
+        '''
+        wheel = TimerWheel(resolution=1)
+        fired = []
+        delays = [1, 63, 64, 65, 4095, 4096, 5000, 262143, 262144, 300000]
+        for ms in delays:
+            wheel.schedule(ms, lambda ms: fired.append((ms, wheel.now)), ms)
+        wheel.advance(300000)
+        self.assertListEqual(fired, [(ms, ms) for ms in delays])
+
+    def test_cancel(self):
+        '''
+        Cancelled timers do not fire, also from a callback of the same tick
+        '''
+        wheel = TimerWheel(resolution=10)
+        fired = []
+
+        def cancelOthers():
+            fired.append('b')
+            a.cancel()
+            c.cancel()
+        a = wheel.schedule(20, fired.append, 'a')
+        b = wheel.schedule(20, cancelOthers)
+        c = wheel.schedule(20, fired.append, 'c')
+        wheel.advance(20)
+        self.assertEqual(fired[-1], 'b', 'nothing fired after cancelling')
+        self.assertEqual(len(wheel), 0)
+        self.assertFalse(b.pending)
+
+if __name__ == '__main__':
+    unittest.main()
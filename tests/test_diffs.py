@@ -0,0 +1,97 @@
+import unittest
+
+from core import createMachine, state, transition, reduce, action, interpret, nested
+from core.diffs import track, untrack, DELETED, Tracked
+
+
+def setKey(ctx, ev):
+    ctx[ev['key']] = ev['value']
+    return ctx
+
+
+def machine():
+    return createMachine({
+        'one': state(
+            transition('merge', 'one', reduce(lambda ctx, ev: ctx | ev['values'])),
+            transition('set', 'one', reduce(setKey)),
+            transition('remove', 'one', reduce(lambda ctx, ev: {k: v for k, v in ctx.items() if k != ev['key']})),
+            transition('touch', 'one', action(lambda ctx: None)),
+            transition('go', 'two')),
+        'two': state()
+    }, lambda: {'a': 1, 'b': [1], 'c': 'x'})
+
+
+class TestDiffs(unittest.TestCase):
+
+    def test_merge(self):
+        '''
+        Changes made with | are tracked, unchanged values are left out
+        '''
+        changes = []
+        service = interpret(machine(), lambda s: changes.append(s.changes))
+        track(service)
+        service.send({'type': 'merge', 'values': {'a': 2, 'c': 'x'}})
+        self.assertDictEqual(changes[-1], {'a': 2})
+        self.assertIsInstance(service.context, Tracked)
+        self.assertDictEqual(service.context, {'a': 2, 'b': [1], 'c': 'x'})
+
+    def test_in_place(self):
+        '''
+        Changes made in place are tracked
+        '''
+        service = interpret(machine())
+        track(service)
+        service.send({'type': 'set', 'key': 'd', 'value': 4})
+        self.assertDictEqual(service.changes, {'d': 4})
+        service.send('touch')
+        self.assertDictEqual(service.changes, {}, 'actions change nothing')
+
+    def test_plain_dict(self):
+        '''
+        Reducers returning other dicts are diffed entirely
+        '''
+        service = interpret(machine())
+        track(service)
+        service.send({'type': 'remove', 'key': 'b'})
+        self.assertDictEqual(service.changes, {'b': DELETED})
+        self.assertIsInstance(service.context, Tracked, 'tracked again')
+        service.send({'type': 'merge', 'values': {'c': 'y'}})
+        self.assertDictEqual(service.changes, {'c': 'y'})
+
+    def test_regions(self):
+        '''
+        Changes made by regions are tracked on the service
+        '''
+        child = createMachine({
+            'x': state(transition('inc', 'x', reduce(lambda ctx: ctx | {'n': ctx['n'] + 1})))
+        })
+        service = interpret(createMachine({'one': nested(child)}, lambda: {'n': 0, 'm': 0}))
+        track(service)
+        service.send('inc')
+        self.assertDictEqual(service.changes, {'n': 1})
+
+    def test_subscriptions(self):
+        '''
+        Key subscriptions use the tracked changes
+        '''
+        calls = []
+        service = interpret(machine())
+        track(service)
+        service.subscribe(lambda s: calls.append(s.context['a']), keys='a')
+        service.send({'type': 'merge', 'values': {'c': 'z'}})
+        service.send({'type': 'merge', 'values': {'a': 5}})
+        self.assertListEqual(calls, [5])
+
+    def test_untrack(self):
+        '''
+        Tracking can be stopped
+        '''
+        service = interpret(machine())
+        track(service)
+        untrack(service)
+        service.send({'type': 'merge', 'values': {'a': 2}})
+        self.assertEqual(service.changes, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret, Event
+
+
+class TestEvent(unittest.TestCase):
+
+    def test_event_object(self):
+        '''
+        Event objects can be sent and read in reducers
+        '''
+        machine = createMachine({
+            'one': state(
+                transition('set', 'two',
+                           reduce(lambda ctx, ev: ctx | {'value': ev.data}))
+            ),
+            'two': state()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send(Event('set', 5))
+        self.assertEqual(service.machine.current, 'two')
+        self.assertEqual(service.context['value'], 5)
+
+    def test_dict_access(self):
+        '''
+        Events can be read as dictionary events
+        '''
+        ev = Event('error', error='oops')
+        self.assertEqual(ev['type'], 'error')
+        self.assertEqual(ev['error'], 'oops')
+        self.assertEqual(ev['data'], None)
+        with self.assertRaises(AttributeError):
+            ev.other = 1
+        with self.assertRaises(KeyError):
+            ev['other']
+        self.assertEqual(ev.get('error'), 'oops')
+        self.assertEqual(ev.get('data', 0), 0)
+        self.assertEqual(ev.get('other'), None)
+        self.assertIn('error', ev)
+        self.assertNotIn('data', ev)
+        self.assertNotIn('other', ev)
+
+    def test_interned_names(self):
+        '''
+        Event names built at runtime match the transitions
+        '''
+        name = ''.join(['pi', 'ng'])
+        machine = createMachine({
+            'one': state(transition(name, 'two')),
+            'two': state()
+        })
+        self.assertIs(Event(''.join(['p', 'ing'])).type,
+                      next(iter(machine.states['one'].transitions)), 'same object')
+
+        service = interpret(machine, lambda: {})
+        service.send(Event(''.join(['p', 'ing'])))
+        self.assertEqual(service.machine.current, 'two')
+
+
+if __name__ == '__main__':
+    unittest.main()
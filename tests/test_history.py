@@ -0,0 +1,146 @@
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret, nested, parallel
+from core.diffs import untrack
+from core.history import record
+
+
+def counter():
+    return createMachine({
+        'even': state(transition('add', 'odd', reduce(lambda ctx, ev: ctx | {'n': ctx['n'] + 1}))),
+        'odd': state(transition('add', 'even', reduce(lambda ctx, ev: ctx | {'n': ctx['n'] + 1})),
+                     transition('clear', 'even', reduce(lambda ctx, ev: {'n': 0})))
+    }, lambda: {'n': 0, 'name': 'counter'})
+
+
+class TestHistory(unittest.TestCase):
+
+    def test_steps(self):
+        '''
+        Records the state, event and context of each transition
+        '''
+        service = interpret(counter())
+        history = record(service, size=8, every=3)
+        for _ in range(5):
+            service.send('add')
+        self.assertEqual(len(history), 6)
+        self.assertEqual(history.step(0), ('odd', 'add', {'n': 5, 'name': 'counter'}))
+        for k in range(6):
+            state, event, context = history.step(k)
+            self.assertEqual(context['n'], 5 - k)
+            self.assertEqual(state, 'odd' if (5 - k) % 2 else 'even')
+        self.assertIsNone(history.step(5)[1], 'recording started')
+
+    def test_deltas(self):
+        '''
+        Only the changes are stored between keyframes
+        '''
+        service = interpret(counter())
+        history = record(service, size=8, every=4)
+        for _ in range(4):
+            service.send('add')
+        stored = [history.at(i)[2:] for i in range(1, 5)]
+        self.assertListEqual(stored, [({'n': 1}, None), ({'n': 2}, None), ({'n': 3}, None),
+                                      ({'n': 4}, {'n': 4, 'name': 'counter'})])
+
+    def test_ring(self):
+        '''
+        Keeps the last size steps
+        '''
+        service = interpret(counter())
+        history = record(service, size=4, every=3)
+        for _ in range(9):
+            service.send('add')
+        service.send('clear')
+        self.assertEqual(len(history), 4)
+        self.assertListEqual([history.step(k)[2] for k in range(4)],
+                             [{'n': 0}, {'n': 9, 'name': 'counter'},
+                              {'n': 8, 'name': 'counter'}, {'n': 7, 'name': 'counter'}])
+        with self.assertRaises(Exception):
+            history.step(4)
+
+    def test_rewind(self):
+        '''
+        Restores an earlier step and continues from it
+        '''
+        changes = []
+        service = interpret(counter(), lambda s: changes.append(s.machine.current))
+        history = record(service, size=8, every=2)
+        for _ in range(5):
+            service.send('add')
+        service.rewind(3)
+        self.assertEqual(service.machine.current, 'even')
+        self.assertEqual(service.context, {'n': 2, 'name': 'counter'})
+        self.assertEqual(changes[-1], 'even')
+        self.assertEqual(len(history), 3)
+        service.send('add')
+        self.assertEqual(service.context['n'], 3)
+        self.assertEqual(history.step(1)[2]['n'], 2)
+        self.assertEqual(service.changes, {'n': 3})
+
+    def test_untracked(self):
+        '''
+        Steps without tracked changes keep the whole context
+        '''
+        service = interpret(counter())
+        history = record(service, size=4, every=100)
+        untrack(service)
+        service.send('add')
+        self.assertEqual(history.at(1)[3], {'n': 1, 'name': 'counter'})
+        self.assertEqual(history.step(0)[2]['n'], 1)
+
+    def test_regions(self):
+        '''
+        Transitions of the regions are recorded in the history of the service
+        '''
+        machine = createMachine({
+            'counting': nested(counter()),
+        }, lambda: {'n': 0, 'name': 'counter'})
+        service = interpret(machine)
+        history = record(service)
+        service.send('add')
+        service.send('add')
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.step(0), ('counting', 'add', {'n': 2, 'name': 'counter'}))
+
+    def test_rewind_composite(self):
+        '''
+        Nested, parallel and invoke states can't be rewound into, the
+        history is kept
+        '''
+        flag = createMachine({
+            'off': state(transition('bold', 'on')),
+            'on': state(transition('bold', 'off'))
+        })
+        machine = createMachine({
+            'closed': state(transition('open', 'editing')),
+            'editing': parallel({'bold': flag, 'italic': createMachine({
+                'off': state(transition('italic', 'on')),
+                'on': state(transition('italic', 'off'))
+            })}, transition('close', 'closed'))
+        })
+        service = interpret(machine)
+        history = record(service)
+        service.send('open')
+        service.send('bold')
+        service.send('italic')
+        with self.assertRaises(Exception):
+            service.rewind(1)
+        self.assertEqual(len(history), 4)
+        service.send('bold')
+        self.assertEqual(service.regions['bold'].machine.current, 'off')
+        service.rewind(4)
+        self.assertEqual(service.machine.current, 'closed')
+        self.assertIsNone(service.regions)
+        service.send('open')
+        service.send('bold')
+        self.assertEqual(service.regions['bold'].machine.current, 'on')
+
+    def test_not_recorded(self):
+        service = interpret(counter())
+        with self.assertRaises(Exception):
+            service.rewind(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import unittest
+
+
+def modulesAfter(code):
+    out = subprocess.run([sys.executable, '-c', code + '; import sys; print(" ".join(sys.modules))'],
+                         capture_output=True, text=True, check=True).stdout
+    return out.split()
+
+
+class TestImport(unittest.TestCase):
+
+    def test_lazy_asyncio(self):
+        '''
+        Importing the library does not import asyncio or typing
+        '''
+        modules = modulesAfter('import core')
+        self.assertNotIn('asyncio', modules, 'asyncio not loaded')
+        self.assertNotIn('typing', modules, 'typing not loaded')
+        self.assertNotIn('core.invocation', modules, 'invoke not loaded')
+
+    def test_invoke_loaded_on_use(self):
+        '''
+        invoke is loaded the first time it is looked up
+        '''
+        modules = modulesAfter('from core import invoke')
+        self.assertIn('core.invocation', modules, 'invoke loaded')
+        self.assertIn('asyncio', modules, 'asyncio loaded with invoke')
+
+    def test_machine_module(self):
+        '''
+        The invoke names are still found in core.machine, loaded on use
+        '''
+        self.assertNotIn('core.invocation', modulesAfter('import core.machine'))
+        modules = modulesAfter('from core.machine import invoke, InvokeFn, InvokeMachine')
+        self.assertIn('core.invocation', modules, 'invoke loaded')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+import unittest
+import asyncio
+import gc
+import warnings
+
+import core.timers
+from core import createMachine, state, transition, reduce, delay, interpret, invoke, invokeAll, invokeAny, state as final
+from core.timers import TimerWheel
+
+
+def child(event):
+    return createMachine({
+        'waiting': state(transition(event, 'finished')),
+        'finished': final()
+    }, lambda ctx: {'from': event})
+
+
+class TestInvokeAll(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_machines(self):
+        '''
+        Waits for all the child machines
+        '''
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': invokeAll([child('a'), child('b')],
+                             transition('done', 'three',
+                                        reduce(lambda ctx, ev: ctx | {'results': ev['data']}))),
+            'three': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertEqual(len(service.children), 2, 'two children running')
+        service.children[1].send('b')
+        self.assertEqual(service.machine.current, 'two', 'still waiting')
+        self.assertEqual(len(service.children), 1, 'one child left')
+        service.children[0].send('a')
+        self.assertEqual(service.machine.current, 'three')
+        self.assertEqual(service.children, [], 'no children')
+        self.assertListEqual(service.context['results'],
+                             [{'from': 'a'}, {'from': 'b'}], 'results in order')
+
+    def test_coroutines(self):
+        '''
+        Runs coroutines and machines together
+        '''
+        async def slow(ctx, ev):
+            await asyncio.sleep(0.02)
+            return 1
+
+        async def fast():
+            return 2
+
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': invokeAll([slow, fast, child('a')],
+                             transition('done', 'three',
+                                        reduce(lambda ctx, ev: ctx | {'results': ev['data']}))),
+            'three': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertEqual(service.machine.current, 'two', 'child machine pending')
+        service.children[0].send('a')
+        self.assertEqual(service.machine.current, 'three')
+        self.assertListEqual(service.context['results'], [1, 2, {'from': 'a'}])
+
+    def test_error(self):
+        '''
+        Goes to error when one of the coroutines fails
+        '''
+        async def fail():
+            raise Exception('oh no')
+
+        async def ok():
+            return 1
+
+        machine = createMachine({
+            'one': invokeAll([ok, fail],
+                             transition('done', 'two'),
+                             transition('error', 'three',
+                                        reduce(lambda ctx, ev: ctx | {'error': ev['error']}))),
+            'two': final(),
+            'three': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        self.assertEqual(service.machine.current, 'three')
+        self.assertEqual(str(service.context['error']), 'oh no')
+
+    def test_any(self):
+        '''
+        invokeAny finishes with the first result and cancels the others
+        '''
+        cancelled = False
+
+        async def slow(ctx, ev):
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        async def fast():
+            await asyncio.sleep(0)
+            return 'fast'
+
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': invokeAny([slow, fast],
+                             transition('done', 'three',
+                                        reduce(lambda ctx, ev: ctx | {'result': ev['data']}))),
+            'three': final()
+        })
+
+        async def main():
+            service = interpret(machine, lambda: {})
+            service.send('go')
+            self.assertEqual(service.machine.current, 'two', 'runs in the loop')
+            await asyncio.sleep(0.05)
+            return service
+
+        service = self.loop.run_until_complete(main())
+        self.assertEqual(service.machine.current, 'three')
+        self.assertEqual(service.context['result'], 'fast')
+        self.assertTrue(cancelled, 'slow was cancelled')
+
+    def test_any_machine(self):
+        '''
+        invokeAny with machines drops the other children
+        '''
+        machine = createMachine({
+            'one': invokeAny([child('a'), child('b')],
+                             transition('done', 'two',
+                                        reduce(lambda ctx, ev: ctx | {'result': ev['data']}))),
+            'two': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.children[1].send('b')
+        self.assertEqual(service.machine.current, 'two')
+        self.assertEqual(service.children, [])
+        self.assertDictEqual(service.context['result'], {'from': 'b'})
+
+    def test_any_losers_exited(self):
+        '''
+        The children that lost are exited: their delays never fire and they
+        no longer report changes
+        '''
+        wheel = core.timers.wheel
+        core.timers.wheel = TimerWheel(resolution=10)
+        self.addCleanup(setattr, core.timers, 'wheel', wheel)
+        slow = createMachine({
+            'waiting': state(delay(100, 'end')),
+            'end': final()
+        })
+        changes = []
+        machine = createMachine({
+            'one': invokeAny([slow, child('b')], transition('done', 'ok')),
+            'ok': final()
+        })
+        service = interpret(machine, lambda s: changes.append(s.machine.current))
+        loser = service.children[0]
+        service.children[1].send('b')
+        self.assertEqual(service.machine.current, 'ok')
+        self.assertListEqual(loser.timers, [])
+        changes.clear()
+        core.timers.wheel.advance(200)
+        self.assertEqual(loser.machine.current, 'waiting')
+        self.assertListEqual(changes, [])
+
+    def test_empty(self):
+        '''
+        Without sources done is sent right away
+        '''
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': invokeAll([], transition('done', 'three',
+                                            reduce(lambda ctx, ev: ctx | {'results': ev['data']}))),
+            'three': final()
+        })
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertEqual(service.machine.current, 'three')
+        self.assertListEqual(service.context['results'], [])
+
+    def test_any_finished_on_entry(self):
+        '''
+        When a source is already done on entry, invokeAny does not create
+        the coroutines of the others
+        '''
+        started = []
+
+        async def work(ctx, ev):
+            started.append(1)
+
+        machine = createMachine({
+            'one': invokeAny([work, createMachine({'finished': final()}), work],
+                             transition('done', 'two')),
+            'two': final()
+        })
+        gc.collect()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', RuntimeWarning)
+            service = interpret(machine, lambda: {})
+            gc.collect()
+        self.assertEqual(service.machine.current, 'two')
+        self.assertListEqual(started, [])
+        self.assertListEqual([str(w.message) for w in caught if w.category is RuntimeWarning], [],
+                             'no coroutine left unawaited')
+
+
+class TestStaleInvoke(unittest.TestCase):
+
+    def test_left_state(self):
+        '''
+        Results of invokes whose state was left are ignored, their task cancelled
+        '''
+        async def slow(ctx, ev):
+            await asyncio.sleep(0.01)
+            return 'slow'
+
+        async def never(ctx, ev):
+            await asyncio.sleep(10)
+
+        machine = createMachine({
+            'idle': state(transition('a', 'A'), transition('b', 'B')),
+            'A': invoke(slow, transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'r': ev.data})),
+                        transition('cancel', 'idle')),
+            'B': invoke(never, transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'r': 'B'})))
+        }, lambda: {'r': None})
+
+        async def test():
+            service = interpret(machine)
+            service.send('a')
+            task = service.tasks[0]
+            service.send('cancel')
+            self.assertListEqual(service.tasks, [])
+            service.send('b')
+            await asyncio.sleep(0.03)
+            self.assertTrue(task.cancelled())
+            self.assertEqual(service.machine.current, 'B')
+            self.assertIsNone(service.context['r'])
+            service.tasks[0].cancel()
+        asyncio.run(test())
+
+    def test_called_once(self):
+        '''
+        Async functions are called once per entry, with the context and event
+        '''
+        calls = []
+
+        async def work(ctx, ev):
+            calls.append((ctx['n'], ev))
+            return ctx['n'] + 1
+
+        machine = createMachine({
+            'idle': state(transition('start', 'running')),
+            'running': invoke(work, transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'n': ev.data})))
+        }, lambda: {'n': 0})
+
+        async def test():
+            service = interpret(machine)
+            for _ in range(3):
+                service.send('start')
+                await asyncio.gather(*service.tasks)
+            self.assertEqual(service.context['n'], 3)
+        gc.collect()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', RuntimeWarning)
+            asyncio.run(test())
+            gc.collect()
+        self.assertListEqual(calls, [(0, 'start'), (1, 'start'), (2, 'start')])
+        self.assertListEqual([str(w.message) for w in caught if w.category is RuntimeWarning], [],
+                             'no coroutine left unawaited')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+from core import createMachine, state, transition, action, interpret
+from core.lanes import Lanes
+from core.policies import coalesce
+
+
+def worker(log):
+    def record(ctx, ev):
+        log.append(ev if type(ev) is str else ev['type'] + str(ev['n']))
+    return createMachine({
+        'working': state(
+            transition('data', 'working', action(record)),
+            transition('control', 'working', action(record)),
+            transition('cancel', 'cancelled', action(record))),
+        'cancelled': state(
+            transition('data', 'cancelled', action(record)),
+            transition('control', 'cancelled', action(record)))
+    })
+
+
+class TestLanes(unittest.TestCase):
+
+    def test_priority(self):
+        '''
+        Higher priority events are processed first
+        '''
+        log = []
+        service = interpret(worker(log))
+        service.lanes = Lanes(3, {'cancel': 0, 'control': 1})
+        for n in range(3):
+            service.post({'type': 'data', 'n': n})
+        service.post({'type': 'control', 'n': 0})
+        service.post('cancel')
+        self.assertListEqual(log, [], 'only queued')
+        self.assertEqual(len(service.lanes), 5)
+        self.assertEqual(service.run(), 5)
+        self.assertListEqual(log, ['cancel', 'control0', 'data0', 'data1', 'data2'])
+        self.assertEqual(service.machine.current, 'cancelled')
+
+    def test_limit(self):
+        '''
+        Runs up to a number of events
+        '''
+        log = []
+        service = interpret(worker(log))
+        service.lanes = Lanes(2, {'control': 0})
+        for n in range(4):
+            service.post({'type': 'data', 'n': n})
+        self.assertEqual(service.run(2), 2)
+        service.post({'type': 'control', 'n': 0})
+        self.assertEqual(service.run(2), 2)
+        self.assertListEqual(log, ['data0', 'data1', 'control0', 'data2'])
+        self.assertEqual(len(service.lanes), 1)
+
+    def test_shedding(self):
+        '''
+        Full lanes shed their oldest events, other lanes are not affected
+        '''
+        log = []
+        service = interpret(worker(log))
+        service.lanes = Lanes(2, {'control': 0}, limits=[None, 2])
+        for n in range(5):
+            service.post({'type': 'data', 'n': n})
+            service.post({'type': 'control', 'n': n})
+        service.run()
+        self.assertListEqual(log, ['control' + str(n) for n in range(5)] + ['data3', 'data4'])
+        self.assertListEqual(service.lanes.shed, [0, 3])
+
+    def test_send(self):
+        '''
+        send still processes right away, nested sends go to the lanes
+        '''
+        log = []
+        service = None
+
+        def burst():
+            service.send({'type': 'data', 'n': 1})
+            service.send('cancel')
+        machine = createMachine({
+            'one': state(transition('go', 'two', action(burst))),
+            'two': state(
+                transition('data', 'two', action(lambda ctx, ev: log.append('data'))),
+                transition('cancel', 'three', action(lambda: log.append('cancel')))),
+            'three': state(transition('data', 'three', action(lambda: log.append('late data'))))
+        })
+        service = interpret(machine)
+        service.lanes = Lanes(2, {'cancel': 0})
+        service.send('go')
+        self.assertListEqual(log, ['cancel', 'late data'])
+
+    def test_coalesce(self):
+        '''
+        Coalesced events wait in the lane of their name
+        '''
+        log = []
+        service = interpret(worker(log))
+        service.lanes = Lanes(2, {'control': 0})
+        coalesce(service, 'data', 'control')
+        for n in range(3):
+            service.post({'type': 'data', 'n': n})
+            service.post({'type': 'control', 'n': n})
+        service.run()
+        self.assertListEqual(log, ['control2', 'data2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
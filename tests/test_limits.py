@@ -0,0 +1,138 @@
+import asyncio
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret, invoke, invokeAll
+from core import limits
+
+
+def run(test):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(test())
+    finally:
+        loop.close()
+
+
+class TestLimits(unittest.TestCase):
+
+    def tearDown(self):
+        limits.unlimit()
+
+    def worker(self, log, fn):
+        async def work(ctx, ev):
+            log.append(('start', ctx['n']))
+            await fn()
+            log.append(('end', ctx['n']))
+            return ctx['n']
+        return createMachine({
+            'idle': state(transition('start', 'working')),
+            'working': invoke(work,
+                              transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'result': ev.data})),
+                              transition('cancel', 'idle'))
+        }, lambda ctx: {'n': ctx['n']})
+
+    def test_concurrency(self):
+        '''
+        At most concurrency invokes run at once, the others wait in order
+        '''
+        async def test():
+            limiter = limits.limit(concurrency=2)
+            log = []
+            running = []
+
+            async def work():
+                running.append(limiter.running)
+                await asyncio.sleep(0.01)
+            machine = self.worker(log, work)
+            services = [interpret(machine, None, {'n': n}) for n in range(6)]
+            for service in services:
+                service.send('start')
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.depth, 4)
+            while any(s.machine.current == 'working' for s in services):
+                await asyncio.sleep(0.005)
+            self.assertEqual(max(running), 2)
+            starts = [n for event, n in log if event == 'start']
+            self.assertListEqual(starts, list(range(6)), 'first in, first out')
+            self.assertListEqual([s.context['result'] for s in services], list(range(6)))
+            stats = limiter.stats()
+            self.assertEqual(stats['started'], 6)
+            self.assertEqual(stats['maxDepth'], 4)
+            self.assertEqual(stats['running'], 0)
+            self.assertGreater(stats['maxWait'], 0.015)
+            self.assertGreater(stats['meanWait'], 0)
+        run(test)
+
+    def test_dropped(self):
+        '''
+        Invokes of states left while waiting are not started
+        '''
+        async def test():
+            limiter = limits.limit(concurrency=1)
+            log = []
+
+            async def work():
+                await asyncio.sleep(0.01)
+            machine = self.worker(log, work)
+            first = interpret(machine, None, {'n': 0})
+            second = interpret(machine, None, {'n': 1})
+            first.send('start')
+            second.send('start')
+            await asyncio.sleep(0)
+            second.send('cancel')
+            await asyncio.sleep(0.03)
+            self.assertListEqual(log, [('start', 0), ('end', 0)])
+            self.assertEqual(limiter.stats()['dropped'], 1)
+            self.assertEqual(limiter.running, 0)
+        run(test)
+
+    def test_rate(self):
+        '''
+        At most rate invokes start per second, after the burst
+        '''
+        async def test():
+            limiter = limits.limit(rate=100, burst=2)
+            log = []
+
+            async def work():
+                pass
+            machine = self.worker(log, work)
+            services = [interpret(machine, None, {'n': n}) for n in range(4)]
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for service in services:
+                service.send('start')
+            while any(s.machine.current == 'working' for s in services):
+                await asyncio.sleep(0.001)
+            self.assertGreaterEqual(loop.time() - start, 0.015)
+            self.assertEqual(limiter.started, 4)
+        run(test)
+
+    def test_invoke_all(self):
+        '''
+        The coroutines of invokeAll share the limit
+        '''
+        async def test():
+            limiter = limits.limit(concurrency=1)
+            running = []
+
+            async def work(ctx, ev):
+                running.append(limiter.running)
+                await asyncio.sleep(0)
+                return 1
+            machine = createMachine({
+                'idle': state(transition('start', 'working')),
+                'working': invokeAll([work, work, work],
+                                     transition('done', 'idle', reduce(lambda ctx, ev: ctx | {'results': ev.data})))
+            }, lambda: {})
+            service = interpret(machine)
+            service.send('start')
+            while service.machine.current == 'working':
+                await asyncio.sleep(0.001)
+            self.assertListEqual(service.context['results'], [1, 1, 1])
+            self.assertListEqual(running, [1, 1, 1])
+        run(test)
+
+
+if __name__ == '__main__':
+    unittest.main()
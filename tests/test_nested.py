@@ -0,0 +1,141 @@
+import unittest
+
+from core import createMachine, state, transition, immediate, delay, reduce, interpret, invoke, nested, parallel, state as final
+
+
+class TestNested(unittest.TestCase):
+
+    def test_nested_state(self):
+        '''
+        Events are sent to the active nested state
+        '''
+        child = createMachine({
+            'idle': state(transition('type', 'typing')),
+            'typing': state(transition('type', 'typing',
+                                       reduce(lambda ctx: ctx | {'keys': ctx['keys'] + 1})))
+        })
+        machine = createMachine({
+            'closed': state(transition('open', 'editing')),
+            'editing': nested(child, transition('close', 'closed')),
+        }, lambda: {'keys': 0})
+
+        service = interpret(machine, lambda: {})
+        self.assertEqual(service.regions, None, 'no regions yet')
+        service.send('open')
+        self.assertEqual(
+            service.regions['editing'].machine.current, 'idle', 'entered the initial child state')
+        service.send('type')
+        service.send('type')
+        self.assertEqual(
+            service.regions['editing'].machine.current, 'typing')
+        self.assertEqual(service.context['keys'], 1, 'context is shared')
+        service.send('close')
+        self.assertEqual(service.machine.current, 'closed')
+        self.assertEqual(service.regions, None, 'regions are exited')
+
+    def test_parent_receives_unhandled(self):
+        '''
+        The parent handles events its regions do not handle
+        '''
+        child = createMachine({
+            'one': state(transition('next', 'two')),
+            'two': state(transition('next', 'one'))
+        })
+        machine = createMachine({
+            'a': nested(child, transition('next', 'b'), transition('skip', 'b')),
+            'b': state()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('next')
+        self.assertEqual(service.machine.current, 'a', 'the region handled it')
+        self.assertEqual(service.regions['a'].machine.current, 'two')
+        service.send('skip')
+        self.assertEqual(service.machine.current, 'b', 'the parent handled it')
+
+    def test_parallel_routing(self):
+        '''
+        Events are only routed to the parallel regions that handle them
+        '''
+        bold = createMachine({
+            'off': state(transition('bold', 'on')),
+            'on': state(transition('bold', 'off'))
+        })
+        italic = createMachine({
+            'off': state(transition('italic', 'on')),
+            'on': state(transition('italic', 'off'))
+        })
+        machine = createMachine({
+            'editor': parallel({'bold': bold, 'italic': italic})
+        })
+
+        self.assertDictEqual(machine.states['editor'].routes,
+                             {'bold': ['bold'], 'italic': ['italic']}, 'routing index')
+        service = interpret(machine, lambda: {})
+        service.send('bold')
+        self.assertEqual(service.regions['bold'].machine.current, 'on')
+        self.assertEqual(service.regions['italic'].machine.current, 'off')
+        service.send('italic')
+        self.assertEqual(service.regions['italic'].machine.current, 'on')
+
+    def test_parallel_done(self):
+        '''
+        A parallel state is done when all its regions are final
+        '''
+        def region(event):
+            return createMachine({
+                'waiting': state(transition(event, 'ready')),
+                'ready': final()
+            })
+        c = 0
+
+        def aux(s):
+            nonlocal c
+            self.assertEqual(s, service, 'changes are reported on the service')
+            c += 1
+        machine = createMachine({
+            'loading': parallel({'a': region('a'), 'b': region('b')},
+                                transition('done', 'loaded')),
+            'loaded': final()
+        })
+
+        service = interpret(machine, aux)
+        service.send('a')
+        self.assertEqual(service.machine.current, 'loading')
+        service.send('b')
+        self.assertEqual(service.machine.current, 'loaded')
+        self.assertEqual(c, 3, 'two region changes and one parent change')
+
+    def test_immediate_done(self):
+        '''
+        Nested states that immediately finish go to done
+        '''
+        child = createMachine({
+            'one': state(immediate('two')),
+            'two': final()
+        })
+        machine = createMachine({
+            'start': state(transition('go', 'inner')),
+            'inner': nested(child, transition('done', 'end')),
+            'end': final()
+        })
+
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertEqual(service.machine.current, 'end')
+
+    def test_no_immediate_or_delay(self):
+        '''
+        Nested, parallel and invoke states are only left by events
+        '''
+        inner = createMachine({'one': state(transition('go', 'two')), 'two': final()})
+        with self.assertRaises(Exception):
+            nested(inner, delay(100, 'timeout'))
+        with self.assertRaises(Exception):
+            parallel({'a': inner}, immediate('end'))
+        with self.assertRaises(Exception):
+            invoke(inner, transition('done', 'end'), delay(100, 'timeout'))
+
+
+if __name__ == '__main__':
+    unittest.main()
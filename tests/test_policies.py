@@ -0,0 +1,89 @@
+import unittest
+
+from core import createMachine, state, transition, action, reduce, interpret
+from core.policies import coalesce, debounce, throttle, clear
+from core.timers import TimerWheel
+
+
+def editor(log, burst):
+    return createMachine({
+        'editing': state(
+            transition('input', 'editing',
+                       reduce(lambda ctx, ev: ctx | {'title': ev['value']}),
+                       action(lambda ctx: log.append(ctx['title']))),
+            transition('burst', 'editing',
+                       action(burst)))
+    }, lambda: {'title': ''})
+
+
+class TestPolicies(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=10)
+
+    def interpret(self, log):
+        def burst():
+            for v in 'abc':
+                service.send({'type': 'input', 'value': v})
+        service = interpret(editor(log, burst))
+        service.wheel = self.wheel
+        return service
+
+    def test_coalesce(self):
+        '''
+        Only the latest of the pending events is processed
+        '''
+        log = []
+        service = self.interpret(log)
+        coalesce(service, 'input')
+        service.send('burst')
+        self.assertListEqual(log, ['c'])
+        self.assertEqual(service.policies['input'].dropped, 2)
+        service.send({'type': 'input', 'value': 'd'})
+        self.assertListEqual(log, ['c', 'd'], 'sent right away when idle')
+
+    def test_debounce(self):
+        '''
+        Sends the latest event once the burst is over
+        '''
+        log = []
+        service = self.interpret(log)
+        policy = debounce(service, 'input', 100)
+        for v in 'abc':
+            service.send({'type': 'input', 'value': v})
+            self.wheel.advance(50)
+        self.assertListEqual(log, [])
+        self.wheel.advance(50)
+        self.assertListEqual(log, ['c'])
+        self.assertEqual(policy.dropped, 2)
+
+    def test_throttle(self):
+        '''
+        Sends at most N events per second, keeping the latest of the rest
+        '''
+        log = []
+        service = self.interpret(log)
+        throttle(service, 'input', 10)
+        for v in 'abcd':
+            service.send({'type': 'input', 'value': v})
+        self.assertListEqual(log, ['a'], 'first one right away')
+        self.wheel.advance(100)
+        self.assertListEqual(log, ['a', 'd'], 'latest after the interval')
+        self.wheel.advance(100)
+        service.send({'type': 'input', 'value': 'e'})
+        self.assertListEqual(log, ['a', 'd', 'e'], 'idle again')
+
+    def test_clear(self):
+        '''
+        Policies can be removed
+        '''
+        log = []
+        service = self.interpret(log)
+        debounce(service, 'input', 100)
+        clear(service, 'input')
+        service.send({'type': 'input', 'value': 'a'})
+        self.assertListEqual(log, ['a'])
+        self.assertEqual(service.policies, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
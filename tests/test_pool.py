@@ -0,0 +1,134 @@
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret, invoke, state as final
+
+
+def child():
+    return createMachine({
+        'working': state(transition('finish', 'done')),
+        'done': final()
+    }, lambda ctx: {'n': ctx['n'] * 2})
+
+
+def parent(childMachine, **options):
+    return createMachine({
+        'idle': state(transition('start', 'running')),
+        'running': invoke(childMachine,
+                          transition('done', 'idle',
+                                     reduce(lambda ctx, ev: ctx | {'n': ev.data['n'], 'runs': ctx['runs'] + 1})),
+                          transition('cancel', 'idle'), **options)
+    }, lambda: {'n': 1, 'runs': 0})
+
+
+class TestPool(unittest.TestCase):
+
+    def test_reuse(self):
+        '''
+        Child services are recycled after they finish or the state is left
+        '''
+        machine = parent(child(), reuse=True)
+        pool = machine.states['running'].pool
+        service = interpret(machine)
+        service.send('start')
+        first = service.child
+        self.assertEqual(first.context, {'n': 2})
+        service.send('cancel')
+        self.assertIsNone(service.child)
+        self.assertListEqual(pool.idle, [first])
+        service.send('start')
+        self.assertIs(service.child, first, 'reused')
+        self.assertEqual(service.child.machine.current, 'working')
+        self.assertListEqual(service.children, [first])
+        first.send('finish')
+        self.assertEqual(service.machine.current, 'idle')
+        self.assertEqual(service.context, {'n': 2, 'runs': 1})
+        self.assertListEqual(service.children, [])
+        for _ in range(3):
+            service.send('start')
+            service.child.send('finish')
+        self.assertEqual(service.context, {'n': 16, 'runs': 4})
+        self.assertEqual(pool.created, 1)
+        self.assertEqual(pool.reused, 4)
+
+    def test_shared(self):
+        '''
+        States invoking the same machine share its pool
+        '''
+        definition = child()
+        machine = createMachine({
+            'idle': state(transition('a', 'a'), transition('b', 'b')),
+            'a': invoke(definition, transition('done', 'idle'), transition('cancel', 'idle'), reuse=True),
+            'b': invoke(definition, transition('done', 'idle'), transition('cancel', 'idle'), reuse=True)
+        }, lambda: {'n': 1})
+        pool = machine.states['a'].pool
+        self.assertIs(machine.states['b'].pool, pool)
+        service = interpret(machine)
+        service.send('a')
+        first = service.child
+        service.send('cancel')
+        service.send('b')
+        self.assertIs(service.child, first, 'reused by the other state')
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+    def test_detached(self):
+        '''
+        A released child does not report to its former parent
+        '''
+        changes = []
+        machine = parent(child(), reuse=True)
+        service = interpret(machine, lambda s: changes.append(s))
+        service.send('start')
+        released = service.child
+        service.send('cancel')
+        changes.clear()
+        released.send('finish')
+        self.assertListEqual(changes, [])
+        self.assertEqual(service.machine.current, 'idle')
+
+    def test_final(self):
+        '''
+        Children starting in a final state go back to the pool immediately
+        '''
+        done = createMachine({'done': final()}, lambda ctx: {'n': ctx['n'] + 1})
+        machine = parent(done, reuse=True)
+        service = interpret(machine)
+        for _ in range(3):
+            service.send('start')
+        self.assertEqual(service.context, {'n': 4, 'runs': 3})
+        pool = machine.states['running'].pool
+        self.assertEqual((pool.created, pool.reused), (1, 2))
+
+    def test_nested(self):
+        '''
+        Pooled children of pooled children are released with them
+        '''
+        inner = child()
+        middle = createMachine({
+            'waiting': invoke(inner, transition('done', 'done')),
+            'done': final()
+        }, lambda ctx: {'n': ctx['n']})
+        machine = parent(middle, reuse=True)
+        service = interpret(machine)
+        service.send('start')
+        service.send('cancel')
+        service.send('start')
+        service.child.child.send('finish')
+        self.assertEqual(service.machine.current, 'idle')
+        self.assertEqual(service.context['runs'], 1)
+
+    def test_default(self):
+        '''
+        Without reuse every entry interprets a new child
+        '''
+        machine = parent(child())
+        service = interpret(machine)
+        service.send('start')
+        first = service.child
+        service.send('cancel')
+        service.send('start')
+        self.assertIsNot(service.child, first)
+        self.assertIsNone(machine.states['running'].pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+
+from core import createMachine, state, transition, action, reduce, interpret, nested, state as final
+
+
+class TestQueue(unittest.TestCase):
+
+    def test_send_from_action(self):
+        '''
+        Events sent from an action run after the current transition
+        '''
+        log = []
+
+        def a():
+            service.send('pong')
+            log.append('after send')
+        machine = createMachine({
+            'one': state(transition('ping', 'two', action(a))),
+            'two': state(transition('pong', 'three')),
+            'three': final()
+        })
+
+        def aux(s):
+            log.append(s.machine.current)
+        service = interpret(machine, aux)
+        service.send('ping')
+        self.assertListEqual(log, ['after send', 'two', 'three'], 'in order')
+        self.assertEqual(service.machine.current, 'three')
+
+    def test_bounded_stack(self):
+        '''
+        Sending from onChange does not grow the stack
+        '''
+        count = 0
+        machine = createMachine({
+            'a': state(transition('next', 'b',
+                                  reduce(lambda ctx: ctx | {'n': ctx['n'] + 1}))),
+            'b': state(transition('next', 'a',
+                                  reduce(lambda ctx: ctx | {'n': ctx['n'] + 1})))
+        }, lambda: {'n': 0})
+
+        def aux(s):
+            nonlocal count
+            count += 1
+            if s.context['n'] < 20000:
+                s.send('next')
+        service = interpret(machine, aux)
+        service.send('next')
+        self.assertEqual(service.context['n'], 20000)
+        self.assertEqual(count, 20000)
+
+    def test_region_sends(self):
+        '''
+        Sends to regions wait for the service they belong to
+        '''
+        log = []
+        child = createMachine({
+            'x': state(transition('go', 'y', action(lambda: log.append('child')))),
+            'y': state()
+        })
+        machine = createMachine({
+            'one': state(transition('go', 'two',
+                                    action(lambda: service.send('go')),
+                                    action(lambda: log.append('parent')))),
+            'two': nested(child)
+        })
+        service = interpret(machine, lambda: {})
+        service.send('go')
+        self.assertListEqual(log, ['parent', 'child'])
+        self.assertEqual(service.regions['two'].machine.current, 'y')
+
+    def test_error_clears_queue(self):
+        '''
+        Events queued by a failing event are dropped
+        '''
+        def fail():
+            service.send('go')
+            raise ValueError('oops')
+        machine = createMachine({
+            'one': state(transition('boom', 'two', action(fail)),
+                         transition('go', 'three')),
+            'two': state(),
+            'three': state()
+        })
+        service = interpret(machine, lambda: {})
+        with self.assertRaises(ValueError):
+            service.send('boom')
+        self.assertEqual(service.machine.current, 'one')
+        self.assertEqual(service.queue, [])
+        service.send('go')
+        self.assertEqual(service.machine.current, 'three', 'still usable')
+
+    def test_post(self):
+        '''
+        Posted events wait for run
+        '''
+        machine = createMachine({
+            'a': state(transition('next', 'b')),
+            'b': state(transition('next', 'c')),
+            'c': state()
+        })
+        service = interpret(machine, lambda: {})
+        service.post('next')
+        service.post('next')
+        self.assertEqual(service.machine.current, 'a', 'not processed yet')
+        self.assertEqual(service.run(1), 1)
+        self.assertEqual(service.machine.current, 'b')
+        self.assertEqual(service.run(), 1)
+        self.assertEqual(service.machine.current, 'c')
+        self.assertEqual(service.queue, [])
+
+    def test_error_keeps_posted(self):
+        '''
+        When an event raises, only the events it queued are dropped, the
+        posted ones after it are kept for the next run
+        '''
+        def fail():
+            service.send('x')
+            raise Exception('failed')
+        machine = createMachine({
+            'off': state(transition('x', 'on'),
+                         transition('bogus', 'off', action(fail))),
+            'on': state(transition('x', 'off'),
+                        transition('y', 'on', reduce(lambda ctx: ctx | {'y': True})),
+                        transition('bogus', 'on', action(fail)))
+        }, lambda: {'y': False})
+        service = interpret(machine)
+        service.post('x')
+        service.post('bogus')
+        service.post('y')
+        service.post('x')
+        with self.assertRaises(Exception):
+            service.run()
+        self.assertEqual(len(service.queue), 2, 'y and x kept, the x of bogus dropped')
+        service.run()
+        self.assertEqual(service.machine.current, 'off')
+        self.assertTrue(service.context['y'])
+        self.assertListEqual(service.queue, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from core import createMachine, state, transition, interpret, immediate, state as final
+from core.registry import Registry
+
+
+def phone():
+    return createMachine({
+        'idle': state(transition('call', 'ringing')),
+        'ringing': state(transition('answer', 'talking'),
+                         transition('shutdown', 'off')),
+        'talking': state(transition('hangup', 'idle'),
+                         transition('shutdown', 'off')),
+        'off': final()
+    })
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_count_by_state(self):
+        '''
+        Counts services by state, kept up to date by transitions
+        '''
+        registry = Registry()
+        machine = phone()
+        services = [registry.add(interpret(machine, lambda: {}))
+                    for _ in range(5)]
+        self.assertDictEqual(registry.countByState(), {'idle': 5})
+        services[0].send('call')
+        services[1].send('call')
+        services[1].send('answer')
+        self.assertDictEqual(registry.countByState(),
+                             {'idle': 3, 'ringing': 1, 'talking': 1})
+        registry.remove(services[2])
+        self.assertDictEqual(registry.countByState(),
+                             {'idle': 2, 'ringing': 1, 'talking': 1})
+        self.assertEqual(len(registry), 4)
+
+    def test_broadcast(self):
+        '''
+        Broadcast only reaches the services in the state
+        '''
+        registry = Registry()
+        machine = phone()
+        services = [registry.add(interpret(machine, lambda: {}))
+                    for _ in range(4)]
+        services[0].send('call')
+        services[1].send('call')
+        self.assertEqual(registry.broadcast('ringing', 'shutdown'), 2)
+        self.assertListEqual([s.machine.current for s in services],
+                             ['off', 'off', 'idle', 'idle'])
+        self.assertEqual(registry.broadcast('ringing', 'shutdown'), 0)
+
+    def test_by_machine(self):
+        '''
+        Services are also indexed by machine definition
+        '''
+        registry = Registry()
+        a = phone()
+        b = phone()
+        registry.add(interpret(a, lambda: {}))
+        registry.add(interpret(b, lambda: {})).send('call')
+        registry.add(interpret(b, lambda: {}))
+        self.assertDictEqual(registry.countByState(b),
+                             {'idle': 1, 'ringing': 1})
+        self.assertEqual(len(registry.services('idle', a)), 1)
+        self.assertEqual(registry.broadcast('idle', 'call', b), 1)
+        self.assertDictEqual(registry.countByState(),
+                             {'idle': 1, 'ringing': 2})
+
+    def test_immediate(self):
+        '''
+        Immediate transitions are tracked
+        '''
+        registry = Registry()
+        machine = createMachine({
+            'one': state(transition('go', 'two')),
+            'two': state(immediate('three')),
+            'three': final()
+        })
+        service = registry.add(interpret(machine, lambda: {}))
+        service.send('go')
+        self.assertDictEqual(registry.countByState(), {'three': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
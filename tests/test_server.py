@@ -0,0 +1,150 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret
+from core.server import Server, Client
+
+
+def door():
+    return createMachine({
+        'closed': state(transition('open', 'opened'),
+                        transition('lock', 'locked', reduce(lambda ctx, ev: ctx | {'code': ev.data}))),
+        'opened': state(transition('close', 'closed')),
+        'locked': state(transition('unlock', 'closed',
+                                   reduce(lambda ctx, ev: ctx if ev.data == ctx['code'] else 1 / 0)))
+    }, lambda: {'code': None})
+
+
+def run(test):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(test())
+    finally:
+        loop.close()
+
+
+class TestServer(unittest.TestCase):
+
+    def test_send(self):
+        '''
+        Applies the sends and replies with the states
+        '''
+        async def test():
+            server = Server({'front': interpret(door())}, factory=lambda key: interpret(door()))
+            await server.start()
+            client = Client(port=server.port)
+            self.assertEqual(await client.send('front', 'open'), 'opened')
+            states = await client.batch([('front', 'close'), ('front', {'type': 'lock', 'data': 42}),
+                                         ('back', 'open')])
+            self.assertListEqual(states, ['closed', 'locked', 'opened'])
+            self.assertEqual(server.services['front'].context, {'code': 42})
+            self.assertEqual(server.services['back'].machine.current, 'opened')
+            await client.close()
+            await server.close()
+        run(test)
+
+    def test_errors(self):
+        '''
+        Failed sends are reported, the others are applied
+        '''
+        async def test():
+            server = Server({'front': interpret(door())})
+            await server.start()
+            client = Client(port=server.port)
+            with self.assertRaises(Exception) as error:
+                await client.batch([('front', {'type': 'lock', 'data': 1}), ('other', 'open'),
+                                    ('front', {'type': 'unlock', 'data': 2})])
+            self.assertIn('other', str(error.exception))
+            connection = client.connections[0]
+            reply = await connection.request([['other', 'open'], ['front', {'type': 'unlock', 'data': 1}]])
+            self.assertListEqual(reply['states'], [None, 'closed'])
+            self.assertEqual(reply['errors'][0][0], 0)
+            await client.close()
+            await server.close()
+        run(test)
+
+    def test_pipelining(self):
+        '''
+        Requests written before their replies are read are replied in order
+        '''
+        async def test():
+            server = Server({'front': interpret(door())})
+            await server.start()
+            client = Client(port=server.port, size=1)
+            connection = await client.connection()
+            futures = [connection.request([['front', 'open' if i % 2 == 0 else 'close']])
+                       for i in range(50)]
+            replies = await asyncio.gather(*futures)
+            self.assertListEqual([r['states'][0] for r in replies],
+                                 ['opened', 'closed'] * 25)
+            self.assertListEqual([r['id'] for r in replies], list(range(50)))
+            await client.close()
+            await server.close()
+        run(test)
+
+    def test_pool(self):
+        '''
+        Concurrent requests are spread over up to size connections
+        '''
+        async def test():
+            server = Server(factory=lambda key: interpret(door()))
+            await server.start()
+            client = Client(port=server.port, size=3)
+            states = await asyncio.gather(*[client.send(str(i), 'open') for i in range(20)])
+            self.assertListEqual(states, ['opened'] * 20)
+            self.assertEqual(len(client.connections), 3)
+            self.assertEqual(len(server.services), 20)
+            await client.close()
+            await server.close()
+        run(test)
+
+    @unittest.skipUnless(hasattr(asyncio, 'start_unix_server'), 'no Unix sockets')
+    def test_unix(self):
+        '''
+        Serves on a Unix socket
+        '''
+        async def test():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'machines.sock')
+                server = Server({'front': interpret(door())})
+                await server.start(path=path)
+                client = Client(path=path)
+                self.assertEqual(await client.send('front', 'open'), 'opened')
+                await client.close()
+                await server.close()
+        run(test)
+
+    def test_closed(self):
+        '''
+        Pending requests fail when the connection is lost
+        '''
+        async def test():
+            server = Server({'front': interpret(door())}, limit=10)
+            await server.start()
+            client = Client(port=server.port)
+            with self.assertRaises(Exception):
+                await client.send('front', 'open')
+            self.assertTrue(client.connections[0].closed)
+            await client.close()
+            await server.close()
+        run(test)
+
+    def test_open_error(self):
+        '''
+        Requests waiting for a connection get the error of its opening
+        '''
+        async def test():
+            client = Client(port=1, size=1)
+            results = await asyncio.wait_for(
+                asyncio.gather(client.send('a', 'open'), client.send('b', 'open'),
+                               return_exceptions=True), 5)
+            self.assertTrue(all(isinstance(r, OSError) for r in results), results)
+            self.assertListEqual(client.connections, [])
+            self.assertListEqual(client.opening, [])
+        run(test)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from benchmarks import soak
+
+
+class TestSoak(unittest.TestCase):
+
+    def test_no_leak(self):
+        '''
+        Retained memory and objects do not grow with the events
+        '''
+        for kind in soak.KINDS:
+            leaked, report = soak.soak(kind, events=4000, services=20, samples=4)
+            self.assertListEqual(leaked, [], report)
+
+    def test_event_loop(self):
+        '''
+        The event loop of the soak is closed and the previous one restored
+        '''
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            soak.soak('async invoke', events=100, services=2, samples=2)
+            self.assertIs(soak.installed(), loop)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def test_leak(self):
+        '''
+        Services retaining their transitions are reported
+        '''
+        kept = []
+
+        def leaking():
+            machine, drive = soak.flat()
+
+            def keep(service):
+                kept.append(service.machine)
+                return drive(service)
+            return machine, keep
+        soak.KINDS['leaking'] = leaking
+        try:
+            leaked, report = soak.soak('leaking', events=4000, services=20, samples=4)
+        finally:
+            del soak.KINDS['leaking']
+        self.assertIn('Machine', ' '.join(leaked))
+
+    def test_unawaited(self):
+        '''
+        Coroutines created and never awaited are reported
+        '''
+        async def work():
+            pass
+
+        def wasting():
+            machine, drive = soak.flat()
+
+            def waste(service):
+                work()
+                return drive(service)
+            return machine, waste
+        soak.KINDS['wasting'] = wasting
+        try:
+            leaked, report = soak.soak('wasting', events=400, services=4, samples=2)
+        finally:
+            del soak.KINDS['wasting']
+        self.assertIn('never awaited', ' '.join(leaked))
+
+
+if __name__ == '__main__':
+    unittest.main()
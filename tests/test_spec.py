@@ -0,0 +1,189 @@
+import json
+import os
+import tempfile
+import unittest
+
+from core import interpret
+import core.spec
+from core.spec import load, loadFile, compileSpec
+import core.timers
+from core.timers import TimerWheel
+
+
+def initialContext():
+    return {'title': 'example', 'saves': 0}
+
+
+def isValid(ctx):
+    return len(ctx['title']) > 3
+
+
+def setTitle(ctx, ev):
+    return ctx | {'title': ev['title']}
+
+
+def countSave(ctx):
+    return ctx | {'saves': ctx['saves'] + 1}
+
+
+SPEC = {
+    'initial': 'preview',
+    'context': 'tests.test_spec.initialContext',
+    'states': {
+        'preview': {'on': {'edit': 'editing'}},
+        'editing': {
+            'on': {
+                'input': {'target': 'editing', 'reduce': 'tests.test_spec.setTitle'},
+                'save': [{'target': 'saved', 'guard': 'tests.test_spec.isValid',
+                          'reduce': ['tests.test_spec.countSave']},
+                         'preview']
+            },
+            'delay': [{'ms': 1000, 'target': 'preview'}]
+        },
+        'saved': {'immediate': ['done']},
+        'done': {'final': True}
+    }
+}
+
+
+class TestSpec(unittest.TestCase):
+    def setUp(self):
+        # reading from the cache as if it were free, so specs are written
+        self.readCost = core.spec.readCost
+        core.spec.readCost = 0
+
+    def tearDown(self):
+        core.spec.readCost = self.readCost
+
+    def test_load(self):
+        '''
+        Builds a working machine from a spec
+        '''
+        service = interpret(load(SPEC))
+        self.assertEqual(service.machine.current, 'preview')
+        service.send('edit')
+        service.send({'type': 'input', 'title': 'ok'})
+        service.send('save')
+        self.assertEqual(service.machine.current, 'preview', 'guard failed')
+        service.send('edit')
+        service.send({'type': 'input', 'title': 'a longer title'})
+        service.send('save')
+        self.assertEqual(service.machine.current, 'done')
+        self.assertEqual(service.context['saves'], 1)
+
+    def test_delay(self):
+        '''
+        Delays in specs
+        '''
+        default = core.timers.wheel
+        wheel = core.timers.wheel = TimerWheel()
+        try:
+            service = interpret(load(json.dumps(SPEC)))
+            service.send('edit')
+            wheel.advance(1000)
+            self.assertEqual(service.machine.current, 'preview')
+        finally:
+            core.timers.wheel = default
+
+    def test_nested(self):
+        '''
+        Nested and parallel specs
+        '''
+        toggle = {'states': {'off': {'on': {'toggle': 'on'}}, 'on': {'on': {'toggle': 'off'}}}}
+        machine = load({
+            'states': {
+                'one': {'nested': toggle, 'on': {'next': 'two'}},
+                'two': {'parallel': {'a': toggle, 'b': toggle}}
+            }
+        })
+        service = interpret(machine)
+        service.send('toggle')
+        self.assertEqual(service.regions['one'].machine.current, 'on')
+        service.send('next')
+        service.send('toggle')
+        self.assertEqual(service.regions['a'].machine.current, 'on')
+        self.assertEqual(service.regions['b'].machine.current, 'on')
+
+    def test_validation(self):
+        '''
+        Invalid specs are rejected with the place of the error
+        '''
+        cases = [
+            ({'states': {'one': {'on': {'go': 'two'}}}}, 'machine.one.on.go[0]'),
+            ({'initial': 'x', 'states': {'one': {}}}, 'initial state'),
+            ({'states': {'one': {'onn': {}}}}, 'unknown state key'),
+            ({'states': {'one': {'on': {'go': {'target': 'one', 'guard': 'nodots'}}}}}, 'dotted import path'),
+            ({'states': {'one': {'delay': ['one']}}}, 'positive ms'),
+            ({'states': {'one': {'final': True, 'on': {'go': 'one'}}}}, 'final state'),
+            ({'states': {'one': {'nested': {'states': {'n': {}}}, 'delay': [{'ms': 100, 'target': 'one'}]}}},
+             'nested states have no immediate or delay'),
+            ({'states': {'one': {'invoke': 'app.save', 'immediate': ['one']}}},
+             'invoke states have no immediate or delay'),
+        ]
+        for spec, message in cases:
+            with self.assertRaises(Exception) as context:
+                compileSpec(spec)
+            self.assertIn(message, str(context.exception))
+
+    def test_cache(self):
+        '''
+        Compiled specs are cached on disk by content
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'machine.json')
+            cache = os.path.join(tmp, 'cache')
+            with open(path, 'w') as f:
+                json.dump(SPEC, f)
+            first = loadFile(path, cache)
+            self.assertEqual(len(os.listdir(cache)), 1, 'compiled once')
+            second = loadFile(path, cache)
+            self.assertEqual(len(os.listdir(cache)), 1, 'cache reused')
+            self.assertListEqual(list(first.states), list(second.states))
+            service = interpret(second)
+            service.send('edit')
+            self.assertEqual(service.machine.current, 'editing')
+
+            with open(path, 'w') as f:
+                json.dump(SPEC | {'initial': 'editing'}, f)
+            core.spec.readCost = 0
+            self.assertEqual(loadFile(path, cache).current, 'editing', 'changed spec')
+            self.assertEqual(len(os.listdir(cache)), 2)
+
+    def test_cache_cheap(self):
+        '''
+        Specs compiled faster than they are read are not cached
+        '''
+        core.spec.readCost = 1000000
+        with tempfile.TemporaryDirectory() as cache:
+            self.assertEqual(load(SPEC, cache).current, 'preview')
+            self.assertListEqual(os.listdir(cache), [])
+
+    def test_cache_not_writable(self):
+        '''
+        Specs still load when the cache can't be written
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = os.path.join(tmp, 'file')
+            with open(cache, 'w') as f:
+                f.write('not a directory')
+            self.assertEqual(load(SPEC, cache).current, 'preview')
+
+    def test_cache_order(self):
+        '''
+        Dict specs are compiled in their order, with or without a cache
+        '''
+        spec = {'states': {'start': {'on': {'go': 'end'}}, 'end': {'final': True}}}
+        reordered = {'states': {'end': {'final': True}, 'start': {'on': {'go': 'end'}}}}
+        with tempfile.TemporaryDirectory() as cache:
+            self.assertEqual(load(spec).current, 'start')
+            self.assertEqual(load(spec, cache).current, 'start')
+            self.assertEqual(load(spec, cache).current, 'start', 'from the cache')
+            core.spec.readCost = 0
+            self.assertEqual(load(reordered, cache).current, 'end')
+            self.assertEqual(load({'states': {'end': {'final': True}, 'start': {'on': {'go': 'end'}}}},
+                                  cache).current, 'end')
+            self.assertEqual(len(os.listdir(cache)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import unittest
+
+from core import createMachine, state, transition, reduce, invoke, nested, delay, state as final
+from core.diffs import track
+from core.lanes import Lanes
+from core.policies import debounce
+from core.store import Store
+
+
+def light():
+    return createMachine({
+        'off': state(transition('toggle', 'on', reduce(lambda ctx, ev: ctx | {'count': ctx['count'] + 1}))),
+        'on': state(transition('toggle', 'off'))
+    }, lambda: {'count': 0})
+
+
+def child():
+    return createMachine({
+        'waiting': state(transition('next', 'ready', reduce(lambda ctx, ev: ctx | {'steps': 1}))),
+        'ready': state(transition('finish', 'done')),
+        'done': final()
+    }, lambda: {'steps': 0})
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_capacity(self):
+        '''
+        Keeps at most capacity services in memory, restores the others
+        '''
+        store = Store(light(), self.path, capacity=3)
+        for n in range(10):
+            store.send(str(n), 'toggle')
+        self.assertEqual(len(store), 3)
+        self.assertListEqual(list(store.hot), ['7', '8', '9'])
+        self.assertEqual(len(os.listdir(self.path)), 7)
+        self.assertIn('0', store)
+        service = store.send('0', 'toggle')
+        self.assertEqual(service.machine.current, 'off')
+        store.send('0', 'toggle')
+        self.assertEqual(service.context, {'count': 2})
+        self.assertEqual(store.restored, 1)
+        self.assertEqual(len(os.listdir(self.path)), 7)
+
+    def test_lru(self):
+        '''
+        The least recently used services are evicted first
+        '''
+        store = Store(light(), self.path, capacity=2)
+        store.get('a')
+        store.get('b')
+        store.get('a')
+        store.get('c')
+        self.assertListEqual(list(store.hot), ['a', 'c'])
+
+    def test_idle(self):
+        '''
+        Services not used for idle milliseconds are evicted
+        '''
+        store = Store(light(), self.path, idle=50)
+        store.get('a')
+        store.used['a'] -= 100
+        store.get('b')
+        self.assertListEqual(list(store.hot), ['b'])
+        store.used['b'] -= 100
+        store.trim()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.evicted, 2)
+
+    def test_child(self):
+        '''
+        The invoked child is saved and restored with its parent
+        '''
+        machine = createMachine({
+            'idle': state(transition('start', 'running')),
+            'running': invoke(child(), transition('done', 'finished',
+                                                  reduce(lambda ctx, ev: ctx | {'child': ev.data}))),
+            'finished': state()
+        }, lambda: {})
+        changes = []
+        store = Store(machine, self.path, capacity=1, onChange=lambda s: changes.append(s.machine.current))
+        store.send('a', 'start').child.send('next')
+        store.get('b')
+        self.assertNotIn('a', store.hot)
+        service = store.get('a')
+        self.assertEqual(service.machine.current, 'running')
+        self.assertEqual(service.child.machine.current, 'ready')
+        self.assertEqual(service.child.context, {'steps': 1})
+        self.assertListEqual(service.children, [service.child])
+        changes.clear()
+        service.child.send('finish')
+        self.assertEqual(service.machine.current, 'finished')
+        self.assertEqual(service.context, {'child': {'steps': 1}})
+        self.assertIn('finished', changes)
+
+    def test_regions(self):
+        '''
+        Active regions are restored in their states
+        '''
+        machine = createMachine({
+            'lights': nested(light(), transition('reset', 'done')),
+            'done': state()
+        }, lambda: {'count': 0})
+        store = Store(machine, self.path, capacity=1)
+        store.send('a', 'toggle')
+        store.get('b')
+        service = store.get('a')
+        self.assertEqual(service.regions['lights'].machine.current, 'on')
+        self.assertEqual(service.context, {'count': 1})
+        service.send('toggle')
+        service.send('toggle')
+        self.assertEqual(service.regions['lights'].machine.current, 'on')
+        self.assertEqual(service.context, {'count': 2})
+
+    def test_busy(self):
+        '''
+        Services with pending delayed transitions stay in memory
+        '''
+        machine = createMachine({
+            'idle': state(transition('wait', 'waiting')),
+            'waiting': state(delay(60000, 'idle'))
+        })
+        store = Store(machine, self.path, capacity=1)
+        store.send('a', 'wait')
+        store.get('b')
+        self.assertListEqual(sorted(store.hot), ['a', 'b'], 'over capacity')
+        store.get('c')
+        self.assertListEqual(sorted(store.hot), ['a', 'c'])
+        store.hot['a'].timers[0].cancel()
+
+    def test_busy_events(self):
+        '''
+        Services with events waiting in lanes or policies stay in memory
+        '''
+        store = Store(light(), self.path, capacity=1)
+        store.get('a').lanes = Lanes(2)
+        store.get('a').post('toggle')
+        debounce(store.get('b'), 'toggle', 100).latest = None
+        store.send('b', 'toggle')
+        store.get('c')
+        self.assertListEqual(sorted(store.hot), ['a', 'b', 'c'])
+        store.hot['a'].run()
+        store.hot['b'].policies['toggle'].timer.cancel()
+        store.get('d')
+        self.assertListEqual(sorted(store.hot), ['d'])
+
+    def test_directories(self):
+        '''
+        Missing parent directories are created
+        '''
+        store = Store(light(), self.path + '/one/two', capacity=1)
+        store.get('a')
+        store.get('b')
+        self.assertIn('a', store)
+        self.assertEqual(len(os.listdir(self.path + '/one/two')), 1)
+
+    def test_tracked(self):
+        '''
+        Tracked contexts are saved as dicts
+        '''
+        store = Store(light(), self.path, capacity=1)
+        track(store.send('a', 'toggle'))
+        store.get('b')
+        self.assertEqual(store.get('a').context, {'count': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
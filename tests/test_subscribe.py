@@ -0,0 +1,112 @@
+import unittest
+
+from core import createMachine, state, transition, reduce, interpret, parallel, state as final
+
+
+def counter():
+    return createMachine({
+        'idle': state(transition('start', 'running')),
+        'running': state(
+            transition('inc', 'running',
+                       reduce(lambda ctx: ctx | {'count': ctx['count'] + 1})),
+            transition('rename', 'running',
+                       reduce(lambda ctx, ev: ctx | {'name': ev['name']})),
+            transition('stop', 'idle'))
+    }, lambda: {'count': 0, 'name': 'a'})
+
+
+class TestSubscribe(unittest.TestCase):
+
+    def test_states(self):
+        '''
+        Listeners of states are only called when entering them
+        '''
+        calls = []
+        service = interpret(counter())
+        service.subscribe(lambda s: calls.append(s.machine.current), states=['idle'])
+        service.send('start')
+        service.send('inc')
+        self.assertListEqual(calls, [])
+        service.send('stop')
+        self.assertListEqual(calls, ['idle'])
+
+    def test_events(self):
+        '''
+        Listeners of events
+        '''
+        calls = []
+        service = interpret(counter())
+        service.subscribe(lambda s: calls.append(s.context['count']), events='inc')
+        service.send('start')
+        service.send('inc')
+        service.send('inc')
+        service.send('stop')
+        self.assertListEqual(calls, [1, 2])
+
+    def test_keys(self):
+        '''
+        Listeners of context keys are called when the values change
+        '''
+        calls = []
+        service = interpret(counter())
+        service.subscribe(lambda s: calls.append(s.context['name']), keys=['name'])
+        service.send('start')
+        service.send('inc')
+        service.send({'type': 'rename', 'name': 'b'})
+        service.send({'type': 'rename', 'name': 'b'})
+        self.assertListEqual(calls, ['b'], 'only when it changed')
+
+    def test_combined(self):
+        '''
+        All the given filters must match
+        '''
+        calls = []
+        service = interpret(counter())
+        service.subscribe(lambda s: calls.append(s.context['count']),
+                          states='running', keys='count')
+        service.send('start')
+        service.send('inc')
+        service.send({'type': 'rename', 'name': 'b'})
+        service.send('stop')
+        self.assertListEqual(calls, [1])
+
+    def test_unsubscribe(self):
+        '''
+        Listeners can unsubscribe, onChange is still called for everything
+        '''
+        calls = []
+        changes = []
+        service = interpret(counter(), lambda s: changes.append(s.machine.current))
+        subscription = service.subscribe(lambda s: calls.append(1))
+        service.send('start')
+        subscription.unsubscribe()
+        service.send('inc')
+        self.assertListEqual(calls, [1])
+        self.assertListEqual(changes, ['running', 'running'])
+
+    def test_regions(self):
+        '''
+        The transitions of the regions are reported to the subscriptions of
+        the root, before the done transition they cause
+        '''
+        def region(event):
+            return createMachine({
+                'waiting': state(transition(event, 'ready')),
+                'ready': final()
+            })
+        calls = []
+        service = interpret(createMachine({
+            'loading': parallel({'a': region('a'), 'b': region('b')},
+                                transition('done', 'loaded')),
+            'loaded': final()
+        }))
+        service.subscribe(lambda s: calls.append(s.machine.current), states='ready')
+        service.subscribe(lambda s: calls.append('b'), events='b')
+        service.subscribe(lambda s: calls.append('loaded'), states='loaded')
+        service.send('a')
+        service.send('b')
+        self.assertListEqual(calls, ['loading', 'loading', 'b', 'loaded'])
+
+
+if __name__ == '__main__':
+    unittest.main()